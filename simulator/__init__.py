@@ -1,2 +1,7 @@
-"""ResourceSync simulator module."""
+"""ResourceSync simulator module.
+
+Modules using resync, directly or through simulator.resource, import it
+within the functions that need it, as importing resync slows down the
+startup of the simulator.
+"""
 from ._version import __version__
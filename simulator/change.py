@@ -0,0 +1,127 @@
+"""change.py: Compact records of change events.
+
+A source notifies its observers of each change event with a Change, a
+named tuple holding the id (integer basename) of the changed resource
+and the change attributes. Change memories keep their changes packed in
+ChangeRecords, which takes 46 bytes per change instead of the several
+hundred bytes of a Resource object. Resource objects are only created
+when needed, e.g., to build a resync ChangeList.
+"""
+
+import struct
+from collections import namedtuple
+
+CHANGE_TYPES = (None, 'created', 'updated', 'deleted')
+
+
+class Change(namedtuple('Change', ['id', 'change', 'timestamp',
+                                   'ts_datetime', 'length', 'md5'])):
+    """A change event of the resource with basename str(id).
+
+    The change type is one of CHANGE_TYPES, timestamp and ts_datetime
+    are unix timestamps and md5 is a hex digest; all but id may be None.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, id, change=None, timestamp=None, ts_datetime=None,
+                length=None, md5=None):
+        """Create a Change, attributes other than id default to None."""
+        return super(Change, cls).__new__(cls, id, change, timestamp,
+                                          ts_datetime, length, md5)
+
+    def uri(self, uri_prefix):
+        """Return the URI of the changed resource."""
+        return uri_prefix + str(self.id)
+
+    def resource(self, uri_prefix):
+        """Return the change as a Resource with URI uri_prefix + basename."""
+        from simulator.resource import Resource
+        return Resource(uri=self.uri(uri_prefix), timestamp=self.timestamp,
+                        length=self.length, md5=self.md5, change=self.change,
+                        ts_datetime=self.ts_datetime)
+
+
+class ChangeRecords(object):
+    """A sequence of changes, packed into a single bytearray.
+
+    Changes are added with append() and the oldest changes removed with
+    discard(). Indexing and iteration return Change tuples.
+    """
+
+    # change type, flags, id, timestamp, ts_datetime, length, binary md5
+    RECORD = struct.Struct('<BBiddq16s')
+    HAS_TIMESTAMP = 1
+    HAS_DATETIME = 2
+    HAS_LENGTH = 4
+    HAS_MD5 = 8
+    _NO_MD5 = bytes(16)
+
+    def __init__(self):
+        """Initialize an empty sequence of changes."""
+        self._data = bytearray()
+        self._change_types = dict((change, n)
+                                  for (n, change) in enumerate(CHANGE_TYPES))
+
+    def __len__(self):
+        """Number of changes."""
+        return len(self._data) // self.RECORD.size
+
+    def append(self, change):
+        """Add a Change at the end."""
+        flags = 0
+        timestamp = change.timestamp
+        if timestamp is not None:
+            flags |= self.HAS_TIMESTAMP
+        else:
+            timestamp = 0.0
+        ts_datetime = change.ts_datetime
+        if ts_datetime is not None:
+            flags |= self.HAS_DATETIME
+        else:
+            ts_datetime = 0.0
+        length = change.length
+        if length is not None:
+            flags |= self.HAS_LENGTH
+        else:
+            length = 0
+        if change.md5 is not None:
+            flags |= self.HAS_MD5
+            md5 = bytes.fromhex(change.md5)
+        else:
+            md5 = self._NO_MD5
+        self._data += self.RECORD.pack(self._change_types[change.change],
+                                       flags, change.id, timestamp,
+                                       ts_datetime, length, md5)
+
+    def discard(self, number):
+        """Remove the oldest number changes."""
+        # Deleting from the start of a bytearray does not move the rest
+        del self._data[:number * self.RECORD.size]
+
+    def _change(self, fields):
+        """Return the Change for a tuple of unpacked fields."""
+        (change, flags, id, timestamp, ts_datetime, length, md5) = fields
+        return Change(
+            id, CHANGE_TYPES[change],
+            timestamp if flags & self.HAS_TIMESTAMP else None,
+            ts_datetime if flags & self.HAS_DATETIME else None,
+            length if flags & self.HAS_LENGTH else None,
+            md5.hex() if flags & self.HAS_MD5 else None)
+
+    def __getitem__(self, index):
+        """Return the Change at index."""
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("change index out of range")
+        return self._change(
+            self.RECORD.unpack_from(self._data, index * self.RECORD.size))
+
+    def __iter__(self):
+        """Iterate over the changes, oldest first.
+
+        Iterates over a snapshot so that changes may be added meanwhile.
+        """
+        for fields in self.RECORD.iter_unpack(bytes(self._data)):
+            yield self._change(fields)
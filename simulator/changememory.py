@@ -7,10 +7,13 @@ Created by Bernhard Haslhofer on 2012-04-27.
 
 """
 import logging
+import threading
+from array import array
 
-from resync.change_list import ChangeList
-
+from simulator.change import ChangeRecords
+from simulator.eventlog import EventLog
 from simulator.observer import Observer
+from simulator.sitemap import SitemapWriter
 
 
 class ChangeMemory(Observer):
@@ -29,10 +32,11 @@ class ChangeMemory(Observer):
         self.config = config
         self.uri_path = config['uri_path']
         self.max_changes = config['max_changes']
-        self.changes = []  # stores change events; sorted by event id
+        self.changes = ChangeRecords()  # change events, oldest first
         source.register_observer(self)
         self.logger = logging.getLogger('changememory')
-        self.logger.info("Changememory config: %s " % self.config)
+        self.event_log = EventLog('changememory.events')
+        self.logger.info("Changememory config: %s ", self.config)
 
     def bootstrap(self):
         """Bootstrap the Changememory; should be overridden by subclasses."""
@@ -44,18 +48,38 @@ class ChangeMemory(Observer):
         return len(self.changes)
 
     def notify(self, change):
-        """General procdures for incoming changes. Should be overridden."""
-        self.logger.info("Event: %s" % repr(change))
+        """General procdures for incoming changes. Should be overridden.
+
+        Events are logged to the changememory.events logger, see EventLog.
+        """
+        self.event_log.log(change, self.source.resource_uri_prefix)
 
 
 # A dynamic in-memory change set
 class DynamicChangeList(ChangeMemory):
-    """A change memory that stores changes in an in-memory list."""
+    """A change memory that stores changes in an in-memory list.
+
+    Change entries do not change once recorded, so the <url> entry of
+    each change is serialized once on notify() and kept, UTF-8 encoded,
+    in a buffer alongside the change records. A changelist is then the
+    buffered entries between the document header and footer. The entries
+    are serialized again if the source's resource URIs or the spec
+    version change.
+
+    notify() runs in the simulation thread while snapshot() serves HTTP
+    requests, so both hold a lock while they use the buffer.
+    """
 
     def __init__(self, source, config):
         """Initialize DynamicChangeList with source and config."""
         super(DynamicChangeList, self).__init__(source, config)
         self.spec_version = '1.1'
+        self._entries = bytearray()  # serialized entries, oldest first
+        self._entry_lengths = array('I')  # length of each buffered entry
+        self._first_entry = 0  # index of the oldest entry's length
+        self._entries_key = None  # (URI prefix, spec version) of entries
+        self._writer = None
+        self._lock = threading.Lock()
 
     @property
     def base_uri(self):
@@ -64,14 +88,99 @@ class DynamicChangeList(ChangeMemory):
 
     def generate(self):
         """Generate a list of changes."""
+        from resync.change_list import ChangeList
         changelist = ChangeList(spec_version=self.spec_version)
+        uri_prefix = self.source.resource_uri_prefix
         for change in self.changes:
-            changelist.add(change)
+            changelist.add(change.resource(uri_prefix))
         return changelist
 
+    def as_xml(self, describedby=None, up=None):
+        """Serialize the stored changes as a changelist XML document.
+
+        Writes the same document as generate().as_xml() with md_from set
+        to the first change's timestamp, or its ts_datetime if it has no
+        timestamp, and md_until now, from the serialized entries instead
+        of building a ChangeList.
+        """
+        xml = self.serialize(self.snapshot(), describedby=describedby, up=up)
+        return xml.decode('utf-8')
+
+    def snapshot(self):
+        """Return (md_from, a copy of the serialized entries)."""
+        with self._lock:
+            self._check_entries()
+            md_from = None
+            if self.changes:
+                first = self.changes[0]
+                md_from = first.timestamp
+                if md_from is None:
+                    md_from = first.ts_datetime
+            return (md_from, bytes(self._entries))
+
+    def serialize(self, snapshot, describedby=None, up=None):
+        """Return a snapshot() as UTF-8 encoded XML, see as_xml()."""
+        (md_from, entries) = snapshot
+        writer = SitemapWriter(spec_version=self.spec_version)
+        start = writer.start('changelist', describedby=describedby, up=up,
+                             md_from=md_from, md_until='now')
+        return b''.join([start.encode('utf-8'), entries,
+                         writer.end().encode('utf-8')])
+
     def notify(self, change):
-        """Simply store a change in the in-memory list."""
+        """Store a change and its serialized entry."""
         super(DynamicChangeList, self).notify(change)
-        self.changes.append(change)
-        if (self.max_changes and len(self.changes) > self.max_changes):
-            del self.changes[0:(len(self.changes) - self.max_changes)]
+        with self._lock:
+            self._check_entries()
+            self.changes.append(change)
+            self._add_entry(change)
+            if (self.max_changes and len(self.changes) > self.max_changes):
+                self._discard(len(self.changes) - self.max_changes)
+
+    def _add_entry(self, change):
+        """Serialize the entry of change and add it to the buffer."""
+        entry = self._entry(self._writer, self._entries_key[0], change)
+        self._entries += entry
+        self._entry_lengths.append(len(entry))
+
+    @staticmethod
+    def _entry(writer, uri_prefix, change):
+        """Return the UTF-8 encoded <url> entry of change."""
+        return writer.entry(
+            uri_prefix + str(change.id),
+            timestamp=change.timestamp, length=change.length,
+            md5=change.md5, change=change.change,
+            ts_datetime=change.ts_datetime).encode('utf-8')
+
+    def _discard(self, number):
+        """Remove the oldest number changes and their entries."""
+        self.changes.discard(number)
+        first = self._first_entry
+        lengths = self._entry_lengths
+        del self._entries[:sum(lengths[first:first + number])]
+        first += number
+        if first > 1024 and first * 2 > len(lengths):
+            del lengths[:first]
+            first = 0
+        self._first_entry = first
+
+    def _check_entries(self):
+        """Serialize all entries again if URIs or spec version changed.
+
+        Must be called with the lock held.
+        """
+        key = (self.source.resource_uri_prefix, self.spec_version)
+        if key == self._entries_key:
+            return
+        writer = SitemapWriter(spec_version=self.spec_version)
+        entries = bytearray()
+        entry_lengths = array('I')
+        for change in self.changes:
+            entry = self._entry(writer, key[0], change)
+            entries += entry
+            entry_lengths.append(len(entry))
+        self._writer = writer
+        self._entries = entries
+        self._entry_lengths = entry_lengths
+        self._first_entry = 0
+        self._entries_key = key
@@ -0,0 +1,42 @@
+"""engine.py: A single event loop driving the changes of many sources.
+
+Each source is scheduled according to its own change_delay, so hundreds
+of simulated sources can change concurrently without a thread each.
+"""
+
+import heapq
+import logging
+import time
+
+
+class EventEngine(object):
+    """Simulates change events for a set of sources in one thread."""
+
+    def __init__(self, sources):
+        """Initialize EventEngine with the sources to simulate."""
+        self.sources = list(sources)
+        self.logger = logging.getLogger('engine')
+
+    def run(self):
+        """Run until every source has simulated its max_events events."""
+        self.logger.info("Starting simulation of %d sources..."
+                         % len(self.sources))
+        now = time.time()
+        queue = []  # heap of (due time, source index)
+        for (index, source) in enumerate(self.sources):
+            if not source.simulation_finished:
+                queue.append((now + source.config['change_delay'], index))
+        heapq.heapify(queue)
+        while queue:
+            (due, index) = queue[0]
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            source = self.sources[index]
+            source.simulate_change()
+            if source.simulation_finished:
+                heapq.heappop(queue)
+            else:
+                heapq.heapreplace(
+                    queue, (due + source.config['change_delay'], index))
+        self.logger.info("Finished change simulation")
@@ -0,0 +1,261 @@
+"""eventlog.py: Low-overhead logging of change events.
+
+Provides a logging handler that writes records as JSON lines from a
+background thread, and a filter that samples and rate limits records,
+e.g., for console output. EventLog passes change events to such handlers
+without creating log records. All are configured through the YAML logging
+configuration, for instance:
+
+    filters:
+      sampled:
+        (): simulator.eventlog.SamplingFilter
+        sample_rate: 0.01
+        max_per_second: 10
+    handlers:
+      events:
+        class: simulator.eventlog.JSONLinesHandler
+        filename: resync-events.jsonl
+"""
+
+import collections
+import json
+import logging
+import random
+import threading
+import time
+from json.encoder import encode_basestring_ascii
+
+EVENT_FIELDS = ('id', 'change', 'timestamp', 'ts_datetime', 'length', 'md5')
+
+
+def event_as_json(event, uri_prefix=None):
+    """Return a JSON object with the fields of a change event that are set.
+
+    The uri field is uri_prefix followed by the event id, if uri_prefix is
+    given. Faster than json.dumps() for the str, int and float fields of
+    events.
+    """
+    fields = []
+    if uri_prefix is not None:
+        fields.append('"uri": %s'
+                      % encode_basestring_ascii(uri_prefix + str(event.id)))
+    for field in EVENT_FIELDS:
+        value = getattr(event, field, None)
+        if value is None:
+            continue
+        if isinstance(value, str):
+            value = encode_basestring_ascii(value)
+        else:
+            value = repr(value)
+        fields.append('"%s": %s' % (field, value))
+    return '{' + ', '.join(fields) + '}'
+
+
+class EventLog(object):
+    """Log change events to the logger name with little overhead.
+
+    Events go directly to the JSONLinesHandlers of the logger (and its
+    ancestors while the logger propagates) without creating a log record.
+    Other handlers, and JSONLinesHandlers with filters, are passed an INFO
+    record with message "Event: <repr of event>" as usual. If the logger
+    itself has filters, that record is created first and an event the
+    filters reject goes to no handler at all.
+    """
+
+    def __init__(self, name):
+        """Initialize EventLog for the logger name."""
+        self.logger = logging.getLogger(name)
+
+    def log(self, event, uri_prefix=None):
+        """Log a change event if INFO is enabled for the logger.
+
+        The URI of the changed resource is uri_prefix followed by the
+        event id; it is only built when the event is written.
+        """
+        logger = self.logger
+        if logger.disabled or not logger.isEnabledFor(logging.INFO):
+            return
+        created = time.time()
+        record = None
+        if logger.filters:
+            record = self._record(event, uri_prefix)
+            if not logger.filter(record):
+                return
+        current = logger
+        while current is not None:
+            for handler in current.handlers:
+                if logging.INFO < handler.level:
+                    continue
+                if isinstance(handler, JSONLinesHandler) and not handler.filters:
+                    handler.emit_event(logger.name, created, event,
+                                       uri_prefix)
+                    continue
+                if record is None:
+                    record = self._record(event, uri_prefix)
+                handler.handle(record)
+            if not current.propagate:
+                break
+            current = current.parent
+
+    def _record(self, event, uri_prefix):
+        """Return an INFO log record for a change event."""
+        return self.logger.makeRecord(
+            self.logger.name, logging.INFO, '(event)', 0, "Event: %r",
+            (event,), None, extra={'event': event, 'uri_prefix': uri_prefix})
+
+
+class JSONLinesHandler(logging.Handler):
+    """Write log records as JSON lines from a background thread.
+
+    Emitting a record only appends it to a queue. A writer thread formats
+    queued records in batches of up to batch_size, or every flush_interval
+    seconds, and writes them to filename. A change event passed as the
+    extra attribute event (and optionally uri_prefix), or with
+    emit_event(), is written as structured fields. Records emitted after
+    close() are dropped.
+    """
+
+    def __init__(self, filename, mode='a', encoding='utf-8', batch_size=1000,
+                 flush_interval=1.0, level=logging.NOTSET):
+        """Initialize JSONLinesHandler, the file is opened on first emit."""
+        super(JSONLinesHandler, self).__init__(level)
+        self.filename = filename
+        self.mode = mode
+        self.encoding = encoding
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stream = None
+        self._queue = collections.deque()
+        self._wakeup = threading.Event()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def handle(self, record):
+        """Filter and emit record without taking the handler lock.
+
+        Appending to the queue is thread-safe, so emitting threads never
+        wait for the writer.
+        """
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        """Queue record for the writer thread."""
+        if self._closed:
+            return
+        if self._thread is None:
+            self._start()
+        self._queue.append(record)
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def emit_event(self, name, created, event, uri_prefix=None):
+        """Queue a change event logged to logger name at time created."""
+        if self._closed:
+            return
+        if self._thread is None:
+            self._start()
+        self._queue.append((name, created, event, uri_prefix))
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def _start(self):
+        """Open the file and start the writer thread once."""
+        with self._write_lock:
+            if self._thread is None and not self._closed:
+                self.stream = open(self.filename, self.mode,
+                                   encoding=self.encoding)
+                self._thread = threading.Thread(target=self._run,
+                                                name='JSONLinesHandler')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        """Write batches of queued records until closed."""
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def format_record(self, record):
+        """Return the JSON line for a record or a queued event."""
+        if isinstance(record, tuple):
+            (name, created, event, uri_prefix) = record
+            return ('{"time": %r, "logger": %s, "level": "INFO", "event": %s}'
+                    % (created, encode_basestring_ascii(name),
+                       event_as_json(event, uri_prefix)))
+        event = getattr(record, 'event', None)
+        if event is not None:
+            return ('{"time": %r, "logger": %s, "level": %s, "event": %s}'
+                    % (record.created, encode_basestring_ascii(record.name),
+                       encode_basestring_ascii(record.levelname),
+                       event_as_json(event,
+                                     getattr(record, 'uri_prefix', None))))
+        return json.dumps({'time': record.created, 'logger': record.name,
+                           'level': record.levelname,
+                           'message': record.getMessage()})
+
+    def flush(self):
+        """Write all queued records."""
+        with self._write_lock:
+            if self.stream is None:
+                return
+            queue = self._queue
+            lines = []
+            while queue:
+                record = queue.popleft()
+                try:
+                    lines.append(self.format_record(record))
+                except Exception:
+                    if isinstance(record, logging.LogRecord):
+                        self.handleError(record)
+                if len(lines) >= self.batch_size:
+                    self.stream.write('\n'.join(lines) + '\n')
+                    lines = []
+            if lines:
+                self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+
+    def close(self):
+        """Stop the writer thread, write queued records and close the file."""
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        with self._write_lock:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+        super(JSONLinesHandler, self).close()
+
+
+class SamplingFilter(logging.Filter):
+    """Pass a random sample of records, at most max_per_second per second."""
+
+    def __init__(self, name='', sample_rate=1.0, max_per_second=None):
+        """Initialize SamplingFilter."""
+        super(SamplingFilter, self).__init__(name)
+        self.sample_rate = sample_rate
+        self.max_per_second = max_per_second
+        self._second = None
+        self._count = 0
+
+    def filter(self, record):
+        """Return True if record is sampled and within the rate limit."""
+        if not super(SamplingFilter, self).filter(record):
+            return False
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        if self.max_per_second is not None:
+            second = int(record.created)
+            if second != self._second:
+                self._second = second
+                self._count = 0
+            if self._count >= self.max_per_second:
+                return False
+            self._count += 1
+        return True
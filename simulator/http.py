@@ -9,19 +9,19 @@ Created by Bernhard Haslhofer on 2012-04-24.
 """
 
 import threading
+import time
 import os.path
 import logging
+import re
 
 import asyncio
 import tornado.httpserver
 import tornado.ioloop
+import tornado.template
 import tornado.web
 import tornado.platform.asyncio
 
-from resync.source_description import SourceDescription
-from resync.capability_list import CapabilityList
-from resync.change_list import ChangeList
-
+from simulator.profiler import PhaseTimer, SamplingProfiler
 from simulator.source import Source
 
 
@@ -36,15 +36,40 @@ class HTTPInterface(threading.Thread):
 
     http://www.slideshare.net/juokaz/
         restful-web-services-with-python-dynamic-languages-conference
+
+    Each kind of page or document has one route for all sources, which
+    captures the path prefix of the source in its first group; handlers
+    look the source up by its prefix, see BaseRequestHandler. So finding
+    the handler of a request does not take longer with more sources.
+
+    The admin endpoint /admin/profile controls a sampling profiler of
+    all threads, see ProfileHandler. The event listening is set once the
+    server listens on its port; /admin/ready tells whether all sources
+    are bootstrapped.
+
+    With debug, Tornado's debug mode reloads templates and modules on
+    change. Otherwise templates are compiled once before listening.
     """
 
-    def __init__(self, source):
+    # The path prefix of a source, e.g., /tenant1, or empty
+    PREFIX = r"((?:/[^/]+)?)"
+    # Paths under which no source can be served
+    RESERVED_PATHS = ('admin', 'static', 'favicon.ico')
+
+    def __init__(self, source, profiler=None, debug=False):
         """Initialize HTTP interface with default settings and handlers."""
-        super(HTTPInterface, self).__init__()
+        super(HTTPInterface, self).__init__(name='HTTPInterface')
         self.logger = logging.getLogger('http')
-        self._stop = threading.Event()
+        # Not _stop, which would shadow threading.Thread._stop()
+        self._stop_event = threading.Event()
+        self.io_loop = None
+        self.listening = threading.Event()
+        self.debug = debug
         self.source = source
+        self.sources = []
+        self.sources_by_prefix = {}  # {path prefix: source}
         self.port = source.port
+        self.profiler = profiler or SamplingProfiler()
         self.settings = dict(
             title=u"ResourceSync Change Simulator",
             template_path=os.path.join(os.path.dirname(__file__), "templates"),
@@ -52,38 +77,79 @@ class HTTPInterface(threading.Thread):
             autoescape=None,
         )
         self.handlers = [
-            (r"/", HomeHandler, dict(source=self.source)),
-            (r"/\.well-known/resourcesync", SourceDescriptionHandler,
-                dict(source=self.source)),
-            (r"/capabilitylist\.xml", CapabilityListHandler,
-                dict(source=self.source)),
-            (r"%s" % Source.RESOURCE_PATH, ResourcesHandler,
-                dict(source=self.source)),
-            (r"%s/([0-9]+)" % Source.RESOURCE_PATH, ResourceHandler,
-                dict(source=self.source)),
             (r"/(favicon\.ico)", tornado.web.StaticFileHandler,
                 dict(path=self.settings['static_path'])),
+            (r"/admin/profile(?:/(start|stop|clear))?", ProfileHandler,
+                dict(profiler=self.profiler)),
+            (r"/admin/ready", ReadyHandler, dict(sources=self.sources)),
         ]
+        self.source_handlers = []  # routes shared by all sources
+        self._targets = {}  # {route pattern: {path prefix: target}}
+        self.add_source(source)
+
+    def add_source(self, source):
+        """Serve source under its path prefix.
+
+        Sources with a path prefix additionally get the static files
+        under that prefix, so that documents and pages refer to them
+        relative to the source's base URI. Raises ValueError if another
+        source has the same path prefix, or if the prefix is not a single
+        path segment or is reserved.
+        """
+        prefix = source.path_prefix
+        if prefix in self.sources_by_prefix:
+            raise ValueError("Several sources have the path prefix %s"
+                             % prefix)
+        if '/' in prefix[1:] or prefix[1:] in self.RESERVED_PATHS:
+            raise ValueError("Cannot serve a source under %s" % prefix)
+        self.sources.append(source)
+        self.sources_by_prefix[prefix] = source
+        self._add_route(r"%s/\.well-known/resourcesync" % self.PREFIX,
+                        SourceDescriptionHandler, prefix, source)
+        self._add_route(r"%s/capabilitylist\.xml" % self.PREFIX,
+                        CapabilityListHandler, prefix, source)
+        self._add_route(r"%s%s" % (self.PREFIX, Source.RESOURCE_PATH),
+                        ResourcesHandler, prefix, source)
+        self._add_route(r"%s%s/([0-9]+)" % (self.PREFIX, Source.RESOURCE_PATH),
+                        ResourceHandler, prefix, source)
+        if prefix:
+            self._add_route(r"(/[^/]+)/static/(.*)", SourceStaticFileHandler,
+                            prefix, source)
 
         """Initialize resource_list handlers"""
-        if self.source.has_resource_list_builder:
-            resource_list_builder = self.source.resource_list_builder
+        if source.has_resource_list_builder:
+            resource_list_builder = source.resource_list_builder
             if resource_list_builder.config['class'] == "DynamicResourceListBuilder":
-                self.handlers = self.handlers + \
-                    [(r"/%s" % resource_list_builder.path,
-                        ResourceListHandler,
-                        dict(resource_list_builder=resource_list_builder,
-                             source=self.source))]
+                self._add_route(
+                    r"%s/%s" % (self.PREFIX,
+                                re.escape(resource_list_builder.path)),
+                    ResourceListHandler, prefix, resource_list_builder)
 
         """Initialize changememory handlers"""
-        if self.source.has_changememory:
-            changememory = self.source.changememory
+        if source.has_changememory:
+            changememory = source.changememory
             if changememory.config['class'] == "DynamicChangeList":
-                self.handlers = self.handlers + \
-                    [(r"/%s" % changememory.uri_path,
-                        DynamicChangeListHandler,
-                        dict(changememory=changememory,
-                             source=self.source))]
+                self._add_route(
+                    r"%s/%s" % (self.PREFIX, re.escape(changememory.uri_path)),
+                    DynamicChangeListHandler, prefix, changememory)
+
+    def _add_route(self, pattern, handler_class, prefix, target):
+        """Serve target under prefix with the route for pattern.
+
+        The route is added with the first target, later targets are
+        added to the targets dict of the route's handler.
+        """
+        if pattern not in self._targets:
+            self._targets[pattern] = {}
+            kwargs = dict(targets=self._targets[pattern])
+            if handler_class is SourceStaticFileHandler:
+                kwargs['path'] = self.settings['static_path']
+            self.source_handlers.append((pattern, handler_class, kwargs))
+        elif not any(route[0] == pattern and route[1] is handler_class
+                     for route in self.source_handlers):
+            raise ValueError("Cannot serve %s with %s, the path is taken"
+                             % (pattern, handler_class.__name__))
+        self._targets[pattern][prefix] = target
 
     def run(self):
         """Run server."""
@@ -91,63 +157,174 @@ class HTTPInterface(threading.Thread):
         # Set up IOLoop policy for Tornado post 5.0
         # see: https://www.tornadoweb.org/en/stable/asyncio.html#tornado.platform.asyncio.AnyThreadEventLoopPolicy
         asyncio.set_event_loop_policy(tornado.platform.asyncio.AnyThreadEventLoopPolicy())
-        application = tornado.web.Application(
-            handlers=self.handlers,
-            debug=True,
-            **self.settings)
-
-        self.http_server = tornado.httpserver.HTTPServer(application)
+        self.http_server = tornado.httpserver.HTTPServer(self.application())
         self.http_server.listen(self.port)
-        tornado.ioloop.IOLoop.instance().start()
+        self.io_loop = tornado.ioloop.IOLoop.current()
+        self.listening.set()
+        self.io_loop.start()
+
+    def application(self):
+        """Return the Tornado application serving the sources."""
+        handlers = self.handlers
+        if all(source.path_prefix for source in self.sources):
+            handlers = handlers + [
+                (r"/", SourcesHandler, dict(sources=self.sources))]
+        # The home page route matches any single segment, so it comes last
+        handlers = handlers + self.source_handlers + [
+            (r"%s/?" % self.PREFIX, HomeHandler,
+             dict(targets=self.sources_by_prefix, cache={}))]
+        settings = dict(self.settings)
+        if not self.debug:
+            settings['template_loader'] = self.compile_templates()
+        return tornado.web.Application(
+            handlers=handlers,
+            debug=self.debug,
+            **settings)
+
+    def compile_templates(self):
+        """Return a template loader with all templates compiled."""
+        template_path = self.settings['template_path']
+        loader = tornado.template.Loader(
+            template_path, autoescape=self.settings['autoescape'])
+        for name in sorted(os.listdir(template_path)):
+            if name.endswith(".html"):
+                loader.load(name)
+        return loader
 
     def stop(self):
         """Stop server."""
         self.logger.info("Stopping HTTP Interface")
-        tornado.ioloop.IOLoop.instance().stop()
-        self._stop.set()
+        # Stop the loop of this thread, called from another one
+        if self.io_loop is not None:
+            self.io_loop.add_callback(self.io_loop.stop)
+        self._stop_event.set()
 
     def stopped(self):
         """True if server is stopped."""
-        return self._stop.isSet()
+        return self._stop_event.is_set()
 
 
 class BaseRequestHandler(tornado.web.RequestHandler):
-    """Handler for source."""
+    """Handler for a source, or for a document of a source.
+
+    The first path argument is the path prefix of the source, which
+    selects the target of the request in targets, a dict {path prefix:
+    target}. Requests for other prefixes get 404.
+    """
 
     SUPPORTED_METHODS = ("GET")
 
-    def initialize(self, source):
-        """Initialize with supplied source."""
-        self.source = source
+    def initialize(self, targets):
+        """Initialize with supplied targets."""
+        self.targets = targets
+
+    def prepare(self):
+        """Look up the target of the request."""
+        target = self.targets.get(self.path_args[0])
+        if target is None:
+            raise tornado.web.HTTPError(404)
+        self.set_target(target)
+
+    def set_target(self, target):
+        """Set the target of the request, by default the source."""
+        self.source = target
 
 
 class HomeHandler(BaseRequestHandler):
-    """Root URI handler."""
+    """Root URI handler.
 
-    def get(self):
+    The page of a source is rendered at most once every CACHE_TTL seconds,
+    the rendered pages are kept in the cache dict shared by all requests.
+    """
+
+    CACHE_TTL = 1.0
+
+    def initialize(self, targets, cache):
+        """Initialize with supplied targets and page cache."""
+        super(HomeHandler, self).initialize(targets)
+        self.cache = cache
+
+    def get(self, prefix):
         """Implement GET for homepage."""
-        self.render("home.html",
-                    resource_count=self.source.resource_count,
-                    source=self.source)
+        now = time.monotonic()
+        (expires, page) = self.cache.get(prefix, (0.0, None))
+        if page is None or now >= expires:
+            page = self.render_string("home.html",
+                                      resource_count=self.source.resource_count,
+                                      source=self.source)
+            self.cache[prefix] = (now + self.CACHE_TTL, page)
+        self.write(page)
 
 
-class ResourcesHandler(BaseRequestHandler):
-    """Resources subset selection handler."""
+class SourceStaticFileHandler(tornado.web.StaticFileHandler):
+    """Static files under the path prefix of a source.
+
+    Like BaseRequestHandler, the first path argument is the path prefix
+    looked up in targets.
+    """
+
+    def initialize(self, path, targets):
+        """Initialize with the static file path and supplied targets."""
+        super(SourceStaticFileHandler, self).initialize(path)
+        self.targets = targets
+
+    def get(self, prefix, path, include_body=True):
+        """Implement GET for a static file of a known source."""
+        if prefix not in self.targets:
+            raise tornado.web.HTTPError(404)
+        return super(SourceStaticFileHandler, self).get(path, include_body)
+
+    def head(self, prefix, path):
+        """Implement HEAD for a static file of a known source."""
+        return self.get(prefix, path, include_body=False)
+
+
+class SourcesHandler(tornado.web.RequestHandler):
+    """Index of all sources served by a multi-source simulator."""
+
+    SUPPORTED_METHODS = ("GET")
+
+    def initialize(self, sources):
+        """Initialize with supplied sources."""
+        self.sources = sources
 
     def get(self):
+        """Implement GET for the sources index."""
+        self.render("sources.html", sources=self.sources, source=None)
+
+
+class ResourcesHandler(BaseRequestHandler):
+    """Browse the resources in id order, a page at a time.
+
+    The query arguments offset (default 0) and limit (default 100, at
+    most MAX_LIMIT) select the page.
+    """
+
+    MAX_LIMIT = 1000
+
+    def get(self, prefix):
         """Implement GET for resources."""
-        rand_res = sorted(self.source.random_resources(100),
-                          key=lambda res: int(res.basename))
+        try:
+            offset = int(self.get_argument("offset", "0"))
+            limit = int(self.get_argument("limit", "100"))
+        except ValueError:
+            raise tornado.web.HTTPError(400, "Bad offset or limit")
+        if offset < 0 or limit < 1 or limit > self.MAX_LIMIT:
+            raise tornado.web.HTTPError(400, "Bad offset or limit")
         self.render("resource.index.html",
-                    resources=rand_res,
+                    basenames=self.source.resource_page(offset, limit),
+                    offset=offset,
+                    limit=limit,
+                    resource_count=self.source.resource_count,
                     source=self.source)
 
 
 class SourceDescriptionHandler(BaseRequestHandler):
     """The HTTP request handler for the Source Description."""
 
-    def get(self):
+    def get(self, prefix):
         """Implement GET for Source Description."""
+        from resync.source_description import SourceDescription
         source_description = SourceDescription()
         source_description.describedby = self.source.describedby_uri
         source_description.add_capability_list(self.source.capability_list_uri)
@@ -161,8 +338,9 @@ class SourceDescriptionHandler(BaseRequestHandler):
 class CapabilityListHandler(BaseRequestHandler):
     """The HTTP request handler for the Capability List."""
 
-    def get(self):
+    def get(self, prefix):
         """Implement GET for Capability List."""
+        from resync.capability_list import CapabilityList
         capability_list = CapabilityList()
         capability_list.describedby = self.source.describedby_uri
         capability_list.up = self.source.source_description_uri
@@ -180,63 +358,163 @@ class CapabilityListHandler(BaseRequestHandler):
 class ResourceHandler(BaseRequestHandler):
     """Resource handler."""
 
-    def get(self, basename):
-        """Implement GET for resource."""
-        resource = self.source.resource(basename)
-        if resource is None:
+    CHUNK_SIZE = 1024 * 1024  # bytes per write of payload store data
+
+    async def get(self, prefix, basename):
+        """Implement GET for resource.
+
+        Payloads from a payload store are memoryviews of mapped files,
+        they are passed to the connection in chunks without copying.
+        """
+        record = self.source.resource_record(basename)
+        if record is None:
             self.send_error(404)
         else:
-            self.set_header("Content-Type", "text/plain")
-            self.set_header("Content-Length", resource.length)
-            self.set_header("Last-Modified", resource.lastmod)
-            self.set_header("Etag", "\"%s\"" % resource.md5)
-            payload = self.source.resource_payload(basename)
-            self.write(payload)
+            (uri, lastmod, length, md5, timestamp) = record
+            self.set_header("Content-Type", self.source.payload_content_type)
+            self.set_header("Content-Length", length)
+            self.set_header("Last-Modified", lastmod)
+            self.set_header("Etag", "\"%s\"" % md5)
+            payload = self.source.resource_payload(basename, length,
+                                                   timestamp)
+            if isinstance(payload, memoryview):
+                await self.flush()
+                for start in range(0, len(payload), self.CHUNK_SIZE):
+                    await self.request.connection.write(
+                        payload[start:start + self.CHUNK_SIZE])
+            else:
+                self.write(payload)
+
+
+class ReadyHandler(tornado.web.RequestHandler):
+    """Readiness of the simulator: 200 once all sources are bootstrapped.
+
+    Responds with 503 while sources are being bootstrapped.
+    """
 
+    SUPPORTED_METHODS = ("GET")
 
-class ResourceListHandler(tornado.web.RequestHandler):
-    """The HTTP request handler for the Resource List."""
+    def initialize(self, sources):
+        """Initialize with supplied sources."""
+        self.sources = sources
 
-    def initialize(self, source, resource_list_builder):
-        """Initialize with source and resource_list_builder."""
-        self.source = source
-        self.resource_list_builder = resource_list_builder
+    def get(self):
+        """Implement GET for readiness."""
+        self.set_header("Content-Type", "text/plain")
+        if all(source.bootstrapped for source in self.sources):
+            self.write("ready\n")
+        else:
+            self.set_status(503)
+            self.write("bootstrapping\n")
 
-    def generate_resource_list(self):
-        """Create a resource_list."""
-        resource_list = self.resource_list_builder.generate()
-        resource_list.describedby = self.source.describedby_uri
-        resource_list.up = self.source.capability_list_uri
-        resource_list.md_at = 'now'
-        return resource_list.as_xml()
 
-    def get(self):
+class ProfileHandler(tornado.web.RequestHandler):
+    """Admin handler controlling a SamplingProfiler.
+
+    POST /admin/profile/start (optional argument interval in seconds),
+    /admin/profile/stop and /admin/profile/clear control sampling. GET
+    /admin/profile returns the samples so far as collapsed stacks.
+    """
+
+    SUPPORTED_METHODS = ("GET", "POST")
+
+    def initialize(self, profiler):
+        """Initialize with supplied profiler."""
+        self.profiler = profiler
+
+    def get(self, action=None):
+        """Implement GET for the collapsed stacks."""
+        if action is not None:
+            raise tornado.web.HTTPError(405)
+        self.set_header("Content-Type", "text/plain")
+        self.set_header("X-Profiler-Running",
+                        "yes" if self.profiler.running else "no")
+        self.set_header("X-Profiler-Samples", self.profiler.samples)
+        self.write(self.profiler.collapsed())
+
+    def post(self, action=None):
+        """Implement POST for profiler actions."""
+        if action == "start":
+            interval = self.get_argument("interval", None)
+            try:
+                self.profiler.start(
+                    interval=float(interval) if interval else None)
+            except ValueError:
+                raise tornado.web.HTTPError(400, "Bad interval %s" % interval)
+        elif action == "stop":
+            self.profiler.stop()
+        elif action == "clear":
+            self.profiler.clear()
+        else:
+            raise tornado.web.HTTPError(405)
+        self.set_header("Content-Type", "text/plain")
+        self.write("Profiler %s, %d samples\n"
+                   % ("running" if self.profiler.running else "stopped",
+                      self.profiler.samples))
+
+
+class ResourceListHandler(BaseRequestHandler):
+    """The HTTP request handler for the Resource List.
+
+    The targets are resource list builders. The durations of the
+    generate, serialize and write phases are sent in the Server-Timing
+    header.
+    """
+
+    def set_target(self, target):
+        """Set the resource list builder and its source."""
+        self.resource_list_builder = target
+        self.source = target.source
+
+    def generate_resource_list(self, timer):
+        """Create a resource_list, timing the phases with timer."""
+        with timer.phase("generate"):
+            snapshot = self.resource_list_builder.snapshot()
+        with timer.phase("serialize"):
+            return self.resource_list_builder.serialize(
+                snapshot,
+                describedby=self.source.describedby_uri,
+                up=self.source.capability_list_uri)
+
+    def get(self, prefix):
         """Implement GET for Resource List."""
+        timer = PhaseTimer()
+        xml = self.generate_resource_list(timer)
         self.set_header("Content-Type", "application/xml")
-        self.write(self.generate_resource_list())
+        with timer.phase("write"):
+            self.write(xml)
+        self.set_header("Server-Timing", timer.server_timing())
 
 
 # Changememory Handlers
 
-class DynamicChangeListHandler(tornado.web.RequestHandler):
-    """The HTTP request handler for dynamically generated changelists."""
+class DynamicChangeListHandler(BaseRequestHandler):
+    """The HTTP request handler for dynamically generated changelists.
 
-    def initialize(self, source, changememory):
-        """Initialize with source and changememory."""
-        self.source = source
-        self.changememory = changememory
-
-    def generate_change_list(self):
-        """Serialize the changes in the changememory."""
-        change_list = self.changememory.generate()
-        # change_list = ChangeList(resources=changes)
-        change_list.describedby = self.source.describedby_uri
-        change_list.up = self.source.capability_list_uri
-        change_list.md_from = change_list.resources[0].timestamp
-        change_list.md_until = 'now'
-        return change_list.as_xml()
+    The targets are change memories. The durations of the generate,
+    serialize and write phases are sent in the Server-Timing header.
+    """
 
-    def get(self):
+    def set_target(self, target):
+        """Set the change memory and its source."""
+        self.changememory = target
+        self.source = target.source
+
+    def generate_change_list(self, timer):
+        """Serialize the changes in the changememory, timing with timer."""
+        with timer.phase("generate"):
+            snapshot = self.changememory.snapshot()
+        with timer.phase("serialize"):
+            return self.changememory.serialize(
+                snapshot,
+                describedby=self.source.describedby_uri,
+                up=self.source.capability_list_uri)
+
+    def get(self, prefix):
         """Implement GET for Change List."""
+        timer = PhaseTimer()
+        xml = self.generate_change_list(timer)
         self.set_header("Content-Type", "application/xml")
-        self.write(self.generate_change_list())
+        with timer.phase("write"):
+            self.write(xml)
+        self.set_header("Server-Timing", timer.server_timing())
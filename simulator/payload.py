@@ -0,0 +1,162 @@
+"""payload.py: Disk-backed resource payloads.
+
+By default a source generates a resource's payload by repeating its
+basename, which is trivially compressible and cheap to hash. The payload
+stores in this module instead serve slices of large files on disk through
+mmap, so payloads have realistic entropy and sizes without being held in
+memory. The slice of a resource is chosen by a seeded hash of its basename
+and timestamp, so updating a resource changes its content.
+"""
+
+import glob
+import hashlib
+import logging
+import mmap
+import os
+import random
+import tempfile
+
+
+class PayloadStore(object):
+    """An abstract payload store implementation.
+
+    This class doesn't serve payloads, PayloadStore implementations should
+    extend this class and provide a method payload(basename, length,
+    timestamp) returning a bytes-like object, like MmapPayloadStore.
+    """
+
+    content_type = "application/octet-stream"
+
+    def __init__(self, source, config):
+        """Initialize PayloadStore with source and config."""
+        self.source = source
+        self.config = config
+        self.seed = config.get('seed', 0)
+        self.logger = logging.getLogger('payload_store')
+
+    def bootstrap(self):
+        """Bootstrap the PayloadStore; should be overridden by subclasses."""
+        pass
+
+
+class MmapPayloadStore(PayloadStore):
+    """A payload store serving slices of memory mapped files."""
+
+    def __init__(self, source, config):
+        """Initialize MmapPayloadStore with source and config."""
+        super(MmapPayloadStore, self).__init__(source, config)
+        self.files = []  # memoryviews of the mapped files, by size
+
+    def map_files(self, paths):
+        """Memory map the files at paths for reading."""
+        for path in paths:
+            with open(path, 'rb') as fh:
+                if os.fstat(fh.fileno()).st_size == 0:
+                    continue
+                mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            self.files.append(memoryview(mapped))
+        if len(self.files) == 0:
+            raise ValueError("No payload data in %s" % (paths))
+        self.files.sort(key=len)
+        max_payload = self.source.config['average_payload']
+        if len(self.files[-1]) < max_payload:
+            raise ValueError("Largest payload file has %d bytes, but payloads "
+                             "may have up to %d bytes"
+                             % (len(self.files[-1]), max_payload))
+
+    def payload(self, basename, length, timestamp):
+        """Return a slice of one of the files as payload.
+
+        The file and offset are chosen by a seeded hash of basename and
+        timestamp among the files at least length bytes long. The slice
+        is a memoryview of the mapped file, it is not copied.
+        """
+        digest = hashlib.md5(("%s:%s:%r" % (self.seed, basename, timestamp))
+                             .encode('utf-8')).digest()
+        n = int.from_bytes(digest[:8], 'big')
+        files = self.files
+        first = 0  # first file that is large enough
+        while len(files[first]) < length:
+            first += 1
+        data = files[first + n % (len(files) - first)]
+        offset = (n >> 16) % (len(data) - length + 1)
+        return data[offset:offset + length]
+
+
+class BlobPayloadStore(MmapPayloadStore):
+    """Serves payloads from a seeded random binary blob on disk.
+
+    The blob at path is generated with size bytes on bootstrap unless the
+    file already holds the blob of that size and seed, so several sources,
+    processes or runs can share one blob. A blob is generated in a
+    temporary file and then renamed to path, so that files mapped by other
+    processes are never truncated or seen half-written.
+    """
+
+    CHUNK_SIZE = 16 * 1024 * 1024
+
+    def bootstrap(self):
+        """Generate the blob if needed and map it."""
+        path = self.config['path']
+        size = self.config['size']
+        if not self._is_blob(path, size):
+            self.logger.info("Generating %d byte payload blob %s"
+                             % (size, path))
+            self._write_blob(path, size)
+        self.map_files([path])
+
+    def _chunks(self, size):
+        """Generate the seeded blob of size bytes in chunks."""
+        rand = random.Random(self.seed)
+        for start in range(0, size, self.CHUNK_SIZE):
+            n = min(self.CHUNK_SIZE, size - start)
+            yield rand.getrandbits(8 * n).to_bytes(n, 'little')
+
+    def _is_blob(self, path, size):
+        """True if the file at path is the blob of size bytes for the seed.
+
+        Besides the size the first chunk is compared, so that a blob
+        generated with another seed is not reused.
+        """
+        try:
+            if os.path.getsize(path) != size:
+                return False
+            with open(path, 'rb') as fh:
+                for chunk in self._chunks(size):
+                    return fh.read(len(chunk)) == chunk
+        except OSError:
+            return False
+        return True
+
+    def _write_blob(self, path, size):
+        """Write the blob to a temporary file and rename it to path."""
+        (fd, tmp_path) = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)),
+            prefix=os.path.basename(path) + '.')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                for chunk in self._chunks(size):
+                    fh.write(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+class CorpusPayloadStore(MmapPayloadStore):
+    """Serves payloads from a pool of corpus files.
+
+    The corpus config value is a glob pattern or a list of them.
+    """
+
+    def bootstrap(self):
+        """Map the corpus files."""
+        patterns = self.config['corpus']
+        if not isinstance(patterns, list):
+            patterns = [patterns]
+        paths = []
+        for pattern in patterns:
+            paths.extend(path for path in sorted(glob.glob(pattern))
+                         if os.path.isfile(path))
+        self.logger.info("Serving payloads from %d corpus files" % len(paths))
+        self.map_files(paths)
@@ -0,0 +1,133 @@
+"""profiler.py: Profiling hooks for a running simulator.
+
+SamplingProfiler periodically samples the stacks of all threads, i.e.,
+the simulation loop and the HTTP interface, and reports them in the
+collapsed stack format read by flame graph tools such as flamegraph.pl
+and speedscope: one line per distinct stack with frames separated by
+semicolons, followed by the number of samples.
+
+PhaseTimer measures the phases of a request for the Server-Timing header.
+"""
+
+import logging
+import os.path
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class SamplingProfiler(object):
+    """Sample the stacks of all threads every interval seconds."""
+
+    def __init__(self, interval=0.01):
+        """Initialize SamplingProfiler, sampling is started with start()."""
+        self.interval = interval
+        self.logger = logging.getLogger('profiler')
+        self.samples = 0
+        self._stacks = {}  # {collapsed stack: number of samples}
+        self._lock = threading.Lock()
+        self._stop = None  # event stopping the sampling thread
+        self._thread = None
+
+    @property
+    def running(self):
+        """True if the profiler is sampling."""
+        return self._thread is not None
+
+    def start(self, interval=None):
+        """Start sampling in a background thread, if not running already.
+
+        Raises ValueError if the interval is not positive, as sampling
+        without pause would keep the other threads from running.
+        """
+        if interval is not None and not interval > 0:
+            raise ValueError("Sampling interval must be positive, not %r"
+                             % interval)
+        with self._lock:
+            if self._thread is not None:
+                return
+            if interval is not None:
+                self.interval = interval
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run,
+                                            args=(self._stop,),
+                                            name='SamplingProfiler')
+            self._thread.daemon = True
+            self._thread.start()
+        self.logger.info("Started sampling every %fs", self.interval)
+
+    def stop(self):
+        """Stop sampling, keeping the samples taken so far."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+            if thread is not None:
+                self._stop.set()
+        if thread is not None:
+            thread.join()
+            self.logger.info("Stopped sampling after %d samples",
+                             self.samples)
+
+    def clear(self):
+        """Discard all samples."""
+        with self._lock:
+            self._stacks = {}
+            self.samples = 0
+
+    def _run(self, stop):
+        """Take samples until the event stop is set."""
+        own_id = threading.get_ident()
+        while not stop.wait(self.interval):
+            self.sample(skip=own_id)
+
+    def sample(self, skip=None):
+        """Record the current stack of every thread except thread id skip."""
+        names = dict((thread.ident, thread.name)
+                     for thread in threading.enumerate())
+        stacks = []
+        for (thread_id, frame) in sys._current_frames().items():
+            if thread_id == skip:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append("%s (%s:%d)"
+                              % (code.co_name,
+                                 os.path.basename(code.co_filename),
+                                 code.co_firstlineno))
+                frame = frame.f_back
+            frames.append(names.get(thread_id, str(thread_id)))
+            stacks.append(';'.join(reversed(frames)))
+        with self._lock:
+            for stack in stacks:
+                self._stacks[stack] = self._stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Return the samples as collapsed stacks, one per line."""
+        with self._lock:
+            stacks = sorted(self._stacks.items())
+        return ''.join("%s %d\n" % (stack, count) for (stack, count) in stacks)
+
+
+class PhaseTimer(object):
+    """Measure the duration of named phases, e.g., of a request."""
+
+    def __init__(self):
+        """Initialize PhaseTimer without phases."""
+        self.phases = []  # (name, seconds)
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager timing the phase name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def server_timing(self):
+        """Return the phases as Server-Timing header value, in ms."""
+        return ', '.join("%s;dur=%.3f" % (name, seconds * 1000.0)
+                         for (name, seconds) in self.phases)
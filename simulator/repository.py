@@ -0,0 +1,281 @@
+"""repository.py: Compact storage of the resources of a source.
+
+Resource basenames are the decimal string of a positive integer id (e.g.,
+"1"), so records are stored in arrays indexed by id instead of a dict per
+resource, which allows hosting many large sources in one process.
+
+The arrays take 48 bytes per id, and about 60 bytes per resource with
+the spare room left when they grow. Once a resource has been listed its
+formatted lastmod is cached as a str of another 76 bytes, so a served
+source takes about 135 to 165 bytes per resource. The cache halves the
+time to write a resource list, formatting lastmods being its main cost.
+"""
+
+import random
+import threading
+from array import array
+
+from simulator.sitemap import datetime_to_str
+
+MD5_SIZE = 16  # bytes of a binary MD5 digest
+
+
+class Repository(object):
+    """Resource records of a source, keyed by basename.
+
+    Behaves like a read-only mapping from basename to a dict with the
+    keys timestamp, length and md5 (hex string). Records are written
+    with set() and removed with del. The W3C formatted lastmod of each
+    record is cached on first use and dropped when the record changes.
+    set() and del hold a lock, which record() takes to read all fields
+    of a record consistently while it is changed by another thread.
+
+    page() lists the basenames at an offset in id order using a binary
+    indexed (Fenwick) tree counting the ids in the repository. The tree
+    is built on first use and then updated in O(log n) per change.
+    """
+
+    def __init__(self):
+        """Initialize an empty repository."""
+        self._timestamps = array('d')
+        self._lengths = array('q')  # -1 for ids not in the repository
+        self._md5s = bytearray()
+        self._lastmods = []
+        self._ids = array('i')  # ids in the repository, in no order
+        self._positions = array('i')  # index of each id in self._ids
+        self._id_counts = None  # Fenwick tree over ids, see page()
+        self._lock = threading.Lock()  # held by writers, see record()
+
+    def _id(self, basename):
+        """Return the array index for basename, None if not a valid basename."""
+        try:
+            i = int(basename)
+        except (TypeError, ValueError):
+            return None
+        if i < 0 or str(i) != basename:
+            return None
+        return i
+
+    def _grow(self, size):
+        """Extend the arrays to hold ids below size."""
+        missing = size - len(self._lengths)
+        if missing > 0:
+            missing = max(missing, len(self._lengths) // 4)
+            self._timestamps.extend(array('d', bytes(8 * missing)))
+            self._lengths.extend(array('q', [-1]) * missing)
+            self._md5s.extend(bytes(MD5_SIZE * missing))
+            self._lastmods.extend([None] * missing)
+            self._positions.extend(array('i', bytes(4 * missing)))
+            self._id_counts = None  # rebuilt for the new size on use
+
+    def _present(self, basename):
+        """Return the array index if basename is in the repository, else None."""
+        i = self._id(basename)
+        if i is None or i >= len(self._lengths) or self._lengths[i] < 0:
+            return None
+        return i
+
+    def __len__(self):
+        """Number of resources in the repository."""
+        return len(self._ids)
+
+    def __contains__(self, basename):
+        """True if a resource with basename is in the repository."""
+        return self._present(basename) is not None
+
+    def __iter__(self):
+        """Iterate over the basenames in id order."""
+        for i in sorted(self._ids):
+            yield str(i)
+
+    def keys(self):
+        """Return a list of all basenames in id order."""
+        return list(self)
+
+    def __getitem__(self, basename):
+        """Return a dict with timestamp, length and md5 of a resource."""
+        i = self._present(basename)
+        if i is None:
+            raise KeyError(basename)
+        return {'timestamp': self._timestamps[i],
+                'length': self._lengths[i],
+                'md5': self._md5s[i * MD5_SIZE:(i + 1) * MD5_SIZE].hex()}
+
+    def get(self, basename, default=None):
+        """Return the record dict of a resource, or default."""
+        if basename not in self:
+            return default
+        return self[basename]
+
+    def set(self, basename, timestamp, length, md5):
+        """Add or replace the record of a resource; md5 is a hex digest."""
+        i = self._id(basename)
+        if i is None:
+            raise KeyError("Basename %s is not a non-negative integer"
+                           % basename)
+        digest = bytes.fromhex(md5)
+        with self._lock:
+            self._grow(i + 1)
+            if self._lengths[i] < 0:
+                self._positions[i] = len(self._ids)
+                self._ids.append(i)
+                self._count_id(i, 1)
+            self._timestamps[i] = timestamp
+            self._lengths[i] = length
+            self._md5s[i * MD5_SIZE:(i + 1) * MD5_SIZE] = digest
+            self._lastmods[i] = None
+
+    def __delitem__(self, basename):
+        """Remove the record of a resource."""
+        with self._lock:
+            i = self._present(basename)
+            if i is None:
+                raise KeyError(basename)
+            self._lengths[i] = -1
+            self._lastmods[i] = None
+            self._count_id(i, -1)
+            # Move the last id into the place of the removed one before
+            # popping it, so that the moved id is never missing from _ids
+            position = self._positions[i]
+            last = self._ids[-1]
+            self._ids[position] = last
+            self._positions[last] = position
+            self._ids.pop()
+
+    def record(self, basename):
+        """Return (timestamp, lastmod, length, md5) of a resource, or None.
+
+        All fields are of the same version of the record, even if it is
+        updated or deleted concurrently. lastmod is cached.
+        """
+        with self._lock:
+            i = self._present(basename)
+            if i is None:
+                return None
+            lastmod = self._lastmods[i]
+            if lastmod is None:
+                lastmod = datetime_to_str(self._timestamps[i])
+                self._lastmods[i] = lastmod
+            return (self._timestamps[i], lastmod, self._lengths[i],
+                    self._md5s[i * MD5_SIZE:(i + 1) * MD5_SIZE].hex())
+
+    def lastmod(self, basename):
+        """Return the cached W3C Datetime lastmod of a resource."""
+        record = self.record(basename)
+        return None if record is None else record[1]
+
+    def sorted_basenames(self):
+        """Return a list of all basenames in basename order.
+
+        The order is that of the basename strings, which is the resource
+        URI order used in resource lists. The ids are copied in a single
+        call so that concurrent deletes, which move ids within self._ids,
+        cannot make the copy skip ids. A delete in progress may show the
+        moved id twice, hence the set.
+        """
+        ids = self._ids.tolist()
+        return sorted(map(str, set(ids)))
+
+    def records(self, basenames=None):
+        """Iterate over (basename, lastmod, length, md5) in basename order.
+
+        Yields the records of basenames, by default of sorted_basenames().
+        Resources deleted meanwhile are skipped.
+        """
+        if basenames is None:
+            basenames = self.sorted_basenames()
+        lengths = self._lengths
+        timestamps = self._timestamps
+        md5s = self._md5s
+        lastmods = self._lastmods
+        for basename in basenames:
+            i = int(basename)
+            length = lengths[i]
+            if length < 0:
+                continue
+            lastmod = lastmods[i]
+            if lastmod is None:
+                timestamp = timestamps[i]
+                lastmod = lastmods[i] = datetime_to_str(timestamp)
+                if timestamps[i] != timestamp:
+                    # Updated meanwhile, set() may have dropped the cached
+                    # lastmod before it was stored
+                    lastmods[i] = None
+            yield (basename, lastmod, length,
+                   md5s[i * MD5_SIZE:(i + 1) * MD5_SIZE].hex())
+
+    def _count_id(self, i, delta):
+        """Add delta to the count of id i in the Fenwick tree, if built."""
+        counts = self._id_counts
+        if counts is None:
+            return
+        j = i + 1
+        size = len(counts)
+        while j < size:
+            counts[j] += delta
+            j += j & -j
+
+    def _build_id_counts(self):
+        """Build the Fenwick tree counting the ids in the repository.
+
+        Node j holds the number of ids in [j - lowbit(j), j), node 0 is
+        unused.
+        """
+        lengths = self._lengths
+        size = len(lengths) + 1
+        counts = array('i', bytes(4 * size))
+        for j in range(1, size):
+            if lengths[j - 1] >= 0:
+                counts[j] += 1
+            parent = j + (j & -j)
+            if parent < size:
+                counts[parent] += counts[j]
+        self._id_counts = counts
+
+    def _counted_ids(self):
+        """Return the number of ids counted in the Fenwick tree."""
+        counts = self._id_counts
+        total = 0
+        j = len(counts) - 1
+        while j > 0:
+            total += counts[j]
+            j -= j & -j
+        return total
+
+    def page(self, offset=0, limit=100):
+        """Return a list of at most limit basenames in id order.
+
+        The list starts with the resource at offset in id order, which
+        is found in O(log n) without sorting or scanning all ids.
+        """
+        if offset < 0 or offset >= len(self._ids) or limit <= 0:
+            return []
+        if self._id_counts is None or self._counted_ids() != len(self._ids):
+            # Not built yet, or changed concurrently while being built
+            self._build_id_counts()
+        counts = self._id_counts
+        # Find the largest j with fewer than offset + 1 ids below j
+        j = 0
+        remaining = offset
+        step = 1 << (len(counts) - 1).bit_length()
+        while step:
+            if j + step < len(counts) and counts[j + step] <= remaining:
+                j += step
+                remaining -= counts[j]
+            step >>= 1
+        lengths = self._lengths
+        basenames = []
+        while j < len(lengths) and len(basenames) < limit:
+            if lengths[j] >= 0:
+                basenames.append(str(j))
+            j += 1
+        return basenames
+
+    def random_basenames(self, number=1):
+        """Return a list of at most number distinct random basenames.
+
+        Takes time proportional to number, not to the repository size.
+        """
+        ids = self._ids
+        positions = random.sample(range(len(ids)), min(number, len(ids)))
+        return [str(ids[position]) for position in positions]
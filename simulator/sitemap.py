@@ -0,0 +1,176 @@
+"""sitemap.py: Fast serialization of ResourceSync sitemap documents.
+
+The resync library serializes lists by building a Resource object and an
+ElementTree element for every entry. For large simulated sources that
+dominates the cost of a request, so this module writes the same documents
+directly as strings from the source's raw records. The output is byte
+identical to resync's ListBase.as_xml() for the documents the simulator
+generates.
+"""
+
+import io
+import math
+import time
+from xml.etree.ElementTree import Element, ElementTree
+
+# As in resync.sitemap, not imported from there for fast startup
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+RS_NS = 'http://www.openarchives.org/rs/terms/'
+
+
+def _xml_declaration():
+    """Return the XML declaration ElementTree writes for unicode output."""
+    buf = io.StringIO()
+    ElementTree(Element('x')).write(buf, encoding='unicode',
+                                    xml_declaration=True, method='xml')
+    return buf.getvalue()[:-len('<x />')]
+
+
+XML_DECLARATION = _xml_declaration()
+URLSET_START = '<urlset xmlns="%s" xmlns:rs="%s">' % (SITEMAP_NS, RS_NS)
+URLSET_END = '</urlset>'
+
+
+def escape_cdata(text):
+    """Escape text as XML character data, as ElementTree does."""
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text
+
+
+def escape_attrib(text):
+    """Escape text as a double quoted XML attribute value.
+
+    Escapes as ElementTree does, including line breaks and tabs, which
+    would otherwise be normalized to spaces by XML parsers.
+    """
+    text = escape_cdata(text)
+    if '"' in text:
+        text = text.replace('"', '&quot;')
+    if '\r' in text:
+        text = text.replace('\r', '&#13;')
+    if '\n' in text:
+        text = text.replace('\n', '&#10;')
+    if '\t' in text:
+        text = text.replace('\t', '&#09;')
+    return text
+
+
+_seconds_cache = {}  # {int unix seconds: 'YYYY-MM-DDThh:mm:ss'}
+_SECONDS_CACHE_SIZE = 100000
+
+
+def datetime_to_str(timestamp):
+    """Format a unix timestamp as W3C Datetime in UTC, Z notation.
+
+    Produces the same string as resync.w3c_datetime.datetime_to_str()
+    but caches the formatting of the whole seconds part, which is shared
+    by most timestamps of a simulated source. Returns None for None.
+    """
+    if timestamp is None:
+        return None
+    frac, seconds = math.modf(timestamp + 0.0000001)
+    micros = round(frac * 1e6)
+    if micros >= 1000000:
+        micros -= 1000000
+        seconds += 1
+    elif micros < 0:
+        micros += 1000000
+        seconds -= 1
+    seconds = int(seconds)
+    prefix = _seconds_cache.get(seconds)
+    if prefix is None:
+        if len(_seconds_cache) >= _SECONDS_CACHE_SIZE:
+            _seconds_cache.clear()
+        prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
+        _seconds_cache[seconds] = prefix
+    if micros:
+        return '%s.%06dZ' % (prefix, micros)
+    return prefix + 'Z'
+
+
+class SitemapWriter(object):
+    """Write sitemap documents without intermediate Resource objects.
+
+    Follows the conventions of resync.sitemap.Sitemap: spec_version
+    selects ResourceSync '1.0' or '1.1' and add_lastmod writes the change
+    datetime as lastmod for entries without a timestamp (v1.1 only).
+    """
+
+    def __init__(self, spec_version='1.1', add_lastmod=False):
+        """Initialize SitemapWriter."""
+        self.spec_1_0 = (spec_version == '1.0')
+        self.add_lastmod = add_lastmod
+
+    def start(self, capability, describedby=None, up=None,
+              md_at=None, md_from=None, md_until=None):
+        """Return the XML declaration, <urlset> and list level <rs:ln>/<rs:md>.
+
+        The md_* arguments are unix timestamps or 'now'.
+        """
+        parts = [XML_DECLARATION, URLSET_START]
+        for (rel, href) in (('describedby', describedby), ('up', up)):
+            if href is not None:
+                parts.append('<rs:ln href="%s" rel="%s" />'
+                             % (escape_attrib(href), rel))
+        md = [('at', md_at), ('capability', capability),
+              ('from', md_from), ('until', md_until)]
+        atts = []
+        for (name, value) in md:
+            if value == 'now':
+                value = time.time()
+            if name != 'capability':
+                value = datetime_to_str(value)
+            if value is not None:
+                atts.append('%s="%s"' % (name, escape_attrib(value)))
+        parts.append('<rs:md %s />' % ' '.join(atts))
+        return ''.join(parts)
+
+    def end(self):
+        """Return the closing tag of the document."""
+        return URLSET_END
+
+    def resource_entries(self, uri_prefix, records):
+        """Yield <url> entries for (basename, lastmod, length, md5) records.
+
+        The entries are as written for a Resource List, the entry URI is
+        uri_prefix + basename and lastmod is an already formatted W3C
+        Datetime string. Records with a lastmod of None are written
+        without <lastmod>.
+        """
+        prefix = '<url><loc>' + escape_cdata(uri_prefix)
+        for (basename, lastmod, length, md5) in records:
+            if lastmod is None:
+                yield ('%s%s</loc><rs:md hash="md5:%s" length="%d" /></url>'
+                       % (prefix, basename, md5, length))
+            else:
+                yield ('%s%s</loc><lastmod>%s</lastmod>'
+                       '<rs:md hash="md5:%s" length="%d" /></url>'
+                       % (prefix, basename, lastmod, md5, length))
+
+    def entry(self, uri, timestamp=None, length=None, md5=None,
+              change=None, ts_datetime=None):
+        """Return a single <url> entry with the given resource attributes."""
+        parts = ['<url><loc>', escape_cdata(uri), '</loc>']
+        lastmod = datetime_to_str(timestamp)
+        if lastmod is None and (self.spec_1_0 or self.add_lastmod):
+            lastmod = datetime_to_str(ts_datetime)
+        if lastmod is not None:
+            parts.append('<lastmod>%s</lastmod>' % lastmod)
+        atts = []
+        if change is not None:
+            atts.append('change="%s"' % change)
+        if ts_datetime is not None and not self.spec_1_0:
+            atts.append('datetime="%s"' % datetime_to_str(ts_datetime))
+        if md5 is not None:
+            atts.append('hash="md5:%s"' % escape_attrib(md5))
+        if length is not None:
+            atts.append('length="%s"' % length)
+        if atts:
+            parts.append('<rs:md %s />' % ' '.join(atts))
+        parts.append('</url>')
+        return ''.join(parts)
@@ -16,11 +16,10 @@ import hashlib
 import logging
 import time
 
-from resync.hashes import Hashes
-from resync.resource_list import ResourceList
-
+from simulator.change import Change
 from simulator.observer import Observable
-from simulator.resource import Resource
+from simulator.repository import Repository
+from simulator.sitemap import SitemapWriter
 
 
 def compute_md5_for_string(str):
@@ -28,7 +27,7 @@ def compute_md5_for_string(str):
 
     Returns a string containing the digest.
     """
-    if (not isinstance(str, bytes)):
+    if (not isinstance(str, (bytes, memoryview))):
         str = str.encode('utf-8')  # make bytes
     return hashlib.md5(str).hexdigest()
 
@@ -64,6 +63,7 @@ class DynamicResourceListBuilder(object):
 
     def generate(self):
         """Generate a resource_list (snapshot from the source)."""
+        from resync.resource_list import ResourceList
         then = time.time()
         resource_list = ResourceList()
         for r in self.source.resources:
@@ -74,6 +74,38 @@ class DynamicResourceListBuilder(object):
         self.logger.info("Generated resource_list: %f" % (now - then))
         return resource_list
 
+    def as_xml(self, describedby=None, up=None):
+        """Serialize a resource_list snapshot of the source as XML.
+
+        Writes the same document as generate().as_xml() with md_at now,
+        but directly from the source's repository records instead of
+        creating a Resource object per entry. Unlike resync, lists with
+        more than 50000 entries are written as a single sitemap.
+        """
+        return self.serialize(self.snapshot(), describedby=describedby, up=up)
+
+    def snapshot(self):
+        """Return the basenames of the resources to list, in list order."""
+        return self.source.resource_basenames()
+
+    def serialize(self, snapshot, describedby=None, up=None):
+        """Serialize the resources of a snapshot() as XML, see as_xml()."""
+        then = time.time()
+        writer = SitemapWriter()
+        records = self.source.resource_records(snapshot)
+        if self.no_lastmod:
+            records = ((basename, None, length, md5)
+                       for (basename, lastmod, length, md5) in records)
+        xml = [writer.start('resourcelist', describedby=describedby,
+                            up=up, md_at='now')]
+        xml.extend(writer.resource_entries(self.source.resource_uri_prefix,
+                                           records))
+        xml.append(writer.end())
+        xml = ''.join(xml)
+        now = time.time()
+        self.logger.info("Serialized resource_list: %f" % (now - then))
+        return xml
+
 
 class Source(Observable):
     """A source contains a list of resources and changes over time."""
@@ -86,17 +118,19 @@ class Source(Observable):
         super(Source, self).__init__()
         self.logger = logging.getLogger('source')
         self.config = config
-        self.logger.info("Source config: %s " % self.config)
+        self.logger.info("Source config: %s ", self.config)
         self.port = port
+        self._repository = Repository()
         self.base_uri = base_uri
         self.spec_version = spec_version  # Code defaults to 1.1
         self.spec_version_1_1 = (spec_version == '1.1')
         self.no_lastmod = no_lastmod  # No lastmod element if version 1.1 and true
         self.max_res_id = 1
-        self._repository = {}  # {basename, {timestamp, length}}
         self.resource_list_builder = None  # builder implementation
         self.changememory = None  # change memory implementation
+        self.payload_store = None  # payload store implementation
         self.no_events = 0
+        self.bootstrapped = False
 
     # Source capabilities
 
@@ -121,21 +155,57 @@ class Source(Observable):
         """Return True if a source maintains a change memory."""
         return bool(self.changememory is not None)
 
+    def add_payload_store(self, payload_store):
+        """Add a payload store implementation."""
+        self.payload_store = payload_store
+
+    @property
+    def has_payload_store(self):
+        """Return True if payloads are served from a payload store."""
+        return bool(self.payload_store is not None)
+
     # Bootstrap Source
 
     def bootstrap(self):
-        """Bootstrap the source with a set of resources."""
+        """Bootstrap the source with a set of resources.
+
+        Sets bootstrapped once the resources and capabilities are set up.
+        """
         self.logger.info("Bootstrapping source...")
+        if self.has_payload_store:
+            self.payload_store.bootstrap()
         for i in range(self.config['number_of_resources']):
             self._create_resource(notify_observers=False)
         if self.has_changememory:
             self.changememory.bootstrap()
         if self.has_resource_list_builder:
             self.resource_list_builder.bootstrap()
+        self.bootstrapped = True
         self._log_stats()
 
     # Source data accessors
 
+    @property
+    def base_uri(self):
+        """Base URI of all documents and resources of the source."""
+        return self._base_uri
+
+    @base_uri.setter
+    def base_uri(self, base_uri):
+        """Set base URI and the resource URI prefix derived from it."""
+        self._base_uri = base_uri
+        self.resource_uri_prefix = base_uri + Source.RESOURCE_PATH + "/"
+
+    @property
+    def path_prefix(self):
+        """URL path the source is served under, empty unless configured.
+
+        e.g., /tenant1 for a source with path tenant1 in a multi-source
+        configuration.
+        """
+        path = self.config.get('path')
+        return '/' + path.strip('/') if path else ''
+
     @property
     def describedby_uri(self):
         """Description of Source, here assume base_uri."""
@@ -173,6 +243,41 @@ class Source(Observable):
                                   + "because source object has been deleted.")
             yield resource
 
+    def resource_basenames(self):
+        """Return a list of all resource basenames in resource URI order."""
+        return self._repository.sorted_basenames()
+
+    def resource_records(self, basenames=None):
+        """Iterate over raw repository records in resource URI order.
+
+        Yields (basename, lastmod, length, md5) tuples without creating
+        resource objects, for the given list of basenames or for all
+        resources. Resources deleted meanwhile are skipped.
+        """
+        return self._repository.records(basenames)
+
+    def resource_uri(self, basename):
+        """Return the URI of the resource with basename, None if unknown."""
+        if basename not in self._repository:
+            return None
+        return self.resource_uri_prefix + basename
+
+    def resource_record(self, basename):
+        """Return (uri, lastmod, length, md5, timestamp), None if unknown.
+
+        Unlike resource() no resource object is created; the formatted
+        lastmod is cached in the repository and is refreshed when the
+        resource is updated. All values are read at once, so that the
+        length and timestamp can be passed on to resource_payload() for
+        a payload matching the other values.
+        """
+        record = self._repository.record(basename)
+        if record is None:
+            return None
+        (timestamp, lastmod, length, md5) = record
+        return (self.resource_uri_prefix + basename, lastmod, length, md5,
+                timestamp)
+
     @property
     def random_resource(self):
         """Return a single random resource."""
@@ -189,62 +294,82 @@ class Source(Observable):
         internal resource repository. Repositoy values are copied
         into the object.
         """
-        if basename not in self._repository:
+        from simulator.resource import Resource
+        entry = self._repository.get(basename)
+        if entry is None:
             return None
-        uri = self.base_uri + Source.RESOURCE_PATH + "/" + basename
-        timestamp = self._repository[basename]['timestamp']
-        length = self._repository[basename]['length']
-        md5 = compute_md5_for_string(self.resource_payload(basename, length))
-        return Resource(uri=uri, timestamp=timestamp,
-                        length=length, md5=md5)
-
-    def resource_payload(self, basename, length=None):
-        """Generate dummy payload by repeating res_id x length times."""
-        if length is None:
-            length = self._repository[basename]['length']
+        uri = self.resource_uri_prefix + basename
+        return Resource(uri=uri, timestamp=entry['timestamp'],
+                        length=entry['length'], md5=entry['md5'])
+
+    @property
+    def payload_content_type(self):
+        """Media type of resource payloads."""
+        if self.has_payload_store:
+            return self.payload_store.content_type
+        return "text/plain"
+
+    def resource_payload(self, basename, length=None, timestamp=None):
+        """Return the payload of a resource.
+
+        Without a payload store, generate dummy payload by repeating
+        res_id x length times. Otherwise return the bytes-like payload
+        from the store, which depends on the resource's timestamp.
+        """
+        if length is None or timestamp is None:
+            entry = self._repository[basename]
+            length = entry['length'] if length is None else length
+            timestamp = entry['timestamp'] if timestamp is None else timestamp
+        if self.has_payload_store:
+            return self.payload_store.payload(basename, length, timestamp)
         no_repetitions = length // len(basename)
-        content = "".join([basename for x in range(no_repetitions)])
         no_fill_chars = length % len(basename)
-        fillchars = "".join(["x" for x in range(no_fill_chars)])
-        return content + fillchars
+        return basename * no_repetitions + "x" * no_fill_chars
+
+    def resource_page(self, offset=0, limit=100):
+        """Return at most limit basenames from offset in id order."""
+        return self._repository.page(offset, limit)
 
     def random_resources(self, number=1):
         """Return a random set of resources, at most all resources."""
-        if number > len(self._repository):
-            number = len(self._repository)
-        rand_basenames = random.sample(self._repository.keys(), number)
+        rand_basenames = self._repository.random_basenames(number)
         return [self.resource(basename) for basename in rand_basenames]
 
+    @property
+    def simulation_finished(self):
+        """True once the configured number of events has been simulated."""
+        return self.no_events == self.config['max_events']
+
     def simulate_changes(self):
         """Simulate changing resources in the source."""
         self.logger.info("Starting simulation...")
         sleep_time = self.config['change_delay']
-        while self.no_events != self.config['max_events']:
+        while not self.simulation_finished:
             time.sleep(sleep_time)
-            event_type = random.choice(self.config['event_types'])
-            if event_type == "create":
-                self._create_resource()
-            elif event_type == "update" or event_type == "delete":
-                if len(self._repository.keys()) > 0:
-                    basename = random.sample(self._repository.keys(), 1)[0]
-                else:
-                    basename = None
-                if basename is None:
-                    self.no_events = self.no_events + 1
-                    continue
-                if event_type == "update":
-                    self._update_resource(basename)
-                elif event_type == "delete":
-                    self._delete_resource(basename)
-            else:
-                self.logger.error("Event type %s is not supported"
-                                  % event_type)
-            self.no_events = self.no_events + 1
-            if self.no_events % self.config['stats_interval'] == 0:
-                self._log_stats()
-
+            self.simulate_change()
         self.logger.info("Finished change simulation")
 
+    def simulate_change(self):
+        """Simulate a single change event of a random configured type."""
+        event_type = random.choice(self.config['event_types'])
+        if event_type == "create":
+            self._create_resource()
+        elif event_type == "update" or event_type == "delete":
+            basenames = self._repository.random_basenames(1)
+            if len(basenames) == 0:
+                self.no_events = self.no_events + 1
+                return
+            if event_type == "update":
+                self._update_resource(basenames[0])
+            elif event_type == "delete":
+                self._delete_resource(basenames[0])
+        else:
+            self.logger.error("Event type %s is not supported"
+                              % event_type)
+        self.no_events = self.no_events + 1
+        if self.no_events % self.config['stats_interval'] == 0:
+            self._log_stats()
+
     # Private Methods
 
     def _create_resource(self, basename=None, notify_observers=True):
@@ -252,38 +377,37 @@ class Source(Observable):
         if basename is None:
             basename = str(self.max_res_id)
             self.max_res_id += 1
-        timestamp = time.time()
-        length = random.randint(0, self.config['average_payload'])
-        self._repository[basename] = {'timestamp': timestamp, 'length': length}
-        if notify_observers:
-            change = Resource(resource=self.resource(basename), change="created")
-            if self.spec_version_1_1:
-                change.ts_datetime = time.time()
-            if self.no_lastmod:
-                change.timestamp = None
-            self.notify_observers(change)
+        self._write_resource(basename,
+                             "created" if notify_observers else None)
 
     def _update_resource(self, basename):
         """Update a resource, notify observers."""
-        self._delete_resource(basename, notify_observers=False)
-        self._create_resource(basename, notify_observers=False)
-        change = Resource(resource=self.resource(basename), change="updated")
-        if self.spec_version_1_1:
-            change.ts_datetime = time.time()
-        if self.no_lastmod:
-            change.timestamp = None
-        self.notify_observers(change)
+        self._write_resource(basename, "updated")
+
+    def _write_resource(self, basename, change=None):
+        """Write a new version of a resource, notify observers of change.
+
+        Observers are notified with a Change unless change is None.
+        """
+        timestamp = time.time()
+        length = random.randint(0, self.config['average_payload'])
+        md5 = compute_md5_for_string(
+            self.resource_payload(basename, length, timestamp))
+        self._repository.set(basename, timestamp, length, md5)
+        if change is not None:
+            self.notify_observers(Change(
+                int(basename), change,
+                timestamp=None if self.no_lastmod else timestamp,
+                ts_datetime=timestamp if self.spec_version_1_1 else None,
+                length=length, md5=md5))
 
     def _delete_resource(self, basename, notify_observers=True):
         """Delete a given resource, notify observers."""
-        uri = self.resource(basename).uri
         del self._repository[basename]
         if notify_observers:
-            change = Resource(uri=uri, change="deleted")
-            if self.spec_version_1_1:
-                change.ts_datetime = time.time()
-                change.timestamp = None
-            self.notify_observers(change)
+            self.notify_observers(Change(
+                int(basename), "deleted",
+                ts_datetime=time.time() if self.spec_version_1_1 else None))
 
     def _log_stats(self):
         """Output current source statistics via the logger."""
@@ -295,4 +419,6 @@ class Source(Observable):
 
     def __str__(self):
         """Print out the source's resources."""
-        return pprint.pformat(self._repository)
+        repository = self._repository
+        return pprint.pformat(dict((basename, repository[basename])
+                                   for basename in repository))
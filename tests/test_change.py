@@ -0,0 +1,43 @@
+"""Test compact change records."""
+import unittest
+
+from simulator.change import Change, ChangeRecords
+
+
+class TestChangeRecords(unittest.TestCase):
+
+    def test_records(self):
+        changes = [
+            Change(1, "created", timestamp=1234.5, ts_datetime=1234.75,
+                   length=10, md5="0123456789abcdef0123456789abcdef"),
+            Change(2, "deleted", ts_datetime=1300.0),
+            Change(3, "updated", timestamp=1400.25, length=0,
+                   md5="d41d8cd98f00b204e9800998ecf8427e"),
+            Change(4)]
+        records = ChangeRecords()
+        for change in changes:
+            records.append(change)
+        self.assertEqual(len(records), 4)
+        self.assertEqual(list(records), changes)
+        self.assertEqual(records[1], changes[1])
+        self.assertEqual(records[-1], changes[3])
+        self.assertRaises(IndexError, records.__getitem__, 4)
+        records.discard(3)
+        self.assertEqual(list(records), changes[3:])
+        records.discard(3)
+        self.assertEqual(len(records), 0)
+
+    def test_resource(self):
+        change = Change(7, "updated", timestamp=1.5, ts_datetime=2.5,
+                        length=3, md5="d41d8cd98f00b204e9800998ecf8427e")
+        resource = change.resource("http://localhost:8888/resources/")
+        self.assertEqual(resource.uri, "http://localhost:8888/resources/7")
+        self.assertEqual(resource.change, "updated")
+        self.assertEqual(resource.timestamp, 1.5)
+        self.assertEqual(resource.ts_datetime, 2.5)
+        self.assertEqual(resource.length, 3)
+        self.assertEqual(resource.md5, "d41d8cd98f00b204e9800998ecf8427e")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,8 @@
 import unittest
 import random
+import re
 
-from simulator.resource import Resource
+from simulator.change import Change
 from simulator.changememory import DynamicChangeList
 from simulator.source import Source
 
@@ -60,14 +61,50 @@ class TestChangeMemory(unittest.TestCase):
         self.assertEqual(self.changememory.changes[0].length, 66)
         self.assertEqual(self.changememory.changes[49].length, 15)
 
+    def test_as_xml(self):
+        """Test the cached entries match a changelist written by resync"""
+        self.changememory.max_changes = 30
+        self.create_dummy_changes(2000)
+        self.assertEqual(self.strip_now(self.changememory.as_xml()),
+                         self.strip_now(self.resync_as_xml()))
+        self.changememory.source.base_uri = "http://example.org/a&b"
+        self.create_dummy_changes(10)
+        xml = self.changememory.as_xml()
+        self.assertEqual(xml.count("http://example.org/a&amp;b/resources/"),
+                         30)
+        self.assertEqual(self.strip_now(xml),
+                         self.strip_now(self.resync_as_xml()))
+
+    def test_as_xml_from_without_timestamp(self):
+        """Test md_from falls back to the ts_datetime of a deleted entry"""
+        self.changememory.notify(Change(1, change='deleted',
+                                        ts_datetime=1234.0))
+        self.changememory.notify(Change(2, change='created',
+                                        timestamp=2468.0))
+        xml = self.changememory.as_xml()
+        self.assertTrue(' from="1970-01-01T00:20:34Z"' in xml)
+        self.assertEqual(self.strip_now(xml),
+                         self.strip_now(self.resync_as_xml()))
+
+    def resync_as_xml(self):
+        change_list = self.changememory.generate()
+        first = change_list.resources[0]
+        change_list.md_from = (first.timestamp if first.timestamp is not None
+                               else first.ts_datetime)
+        change_list.md_until = 'now'
+        return change_list.as_xml()
+
+    def strip_now(self, xml):
+        return re.sub(r' until="[^"]*"', '', xml)
+
     def create_dummy_changes(self, number=5):
         """Create a given number of dummy changes, use length as a dummy id"""
         for i in range(number):
-            r = Resource(uri="a" + str(i), timestamp=1234.0 * i,
-                         change=random.choice(
-                             ['created', 'updated', 'deleted']),
-                         length=i)
-            self.changememory.notify(r)
+            c = Change(i, timestamp=1234.0 * i,
+                       change=random.choice(
+                           ['created', 'updated', 'deleted']),
+                       length=i)
+            self.changememory.notify(c)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,34 @@
+"""Test the event engine driving several sources."""
+import unittest
+
+from simulator.engine import EventEngine
+from simulator.source import Source
+
+
+class TestEventEngine(unittest.TestCase):
+
+    def test_run(self):
+        sources = []
+        for i in range(1, 4):
+            config = {}
+            config['name'] = "Source %d" % i
+            config['path'] = "source%d" % i
+            config['number_of_resources'] = 10
+            config['change_delay'] = 0
+            config['event_types'] = ['create', 'update', 'delete']
+            config['average_payload'] = 100
+            config['max_events'] = 5 * i
+            config['stats_interval'] = 10
+            source = Source(config, "http://localhost:8888/source%d" % i,
+                            "8888")
+            source.bootstrap()
+            sources.append(source)
+        EventEngine(sources).run()
+        for (i, source) in enumerate(sources, 1):
+            self.assertEqual(source.no_events, 5 * i)
+            self.assertTrue(source.simulation_finished)
+            self.assertEqual(source.path_prefix, "/source%d" % i)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Test structured event logging."""
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from simulator.change import Change
+from simulator.eventlog import EventLog, JSONLinesHandler, SamplingFilter
+
+
+class TestEventLog(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'events.jsonl')
+        self.logger = logging.getLogger('test_eventlog.events')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.handler = JSONLinesHandler(self.filename, batch_size=3)
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+        shutil.rmtree(self.dir)
+
+    def read_lines(self):
+        self.handler.flush()
+        with open(self.filename) as fh:
+            return [json.loads(line) for line in fh]
+
+    def test_events(self):
+        event_log = EventLog('test_eventlog.events')
+        for i in range(10):
+            event_log.log(Change(i, "updated", timestamp=1.5 + i, length=i,
+                                 md5="0123456789abcdef0123456789abcdef"),
+                          "http://x/")
+        self.logger.info("Some %s", "message")
+        lines = self.read_lines()
+        self.assertEqual(len(lines), 11)
+        self.assertEqual(lines[3]['logger'], 'test_eventlog.events')
+        self.assertEqual(lines[3]['level'], 'INFO')
+        self.assertEqual(lines[3]['event']['uri'], "http://x/3")
+        self.assertEqual(lines[3]['event']['timestamp'], 4.5)
+        self.assertEqual(lines[3]['event']['length'], 3)
+        self.assertEqual(lines[3]['event']['id'], 3)
+        self.assertEqual(lines[3]['event']['md5'],
+                         "0123456789abcdef0123456789abcdef")
+        self.assertEqual(lines[3]['event']['change'], "updated")
+        self.assertEqual(lines[10]['message'], "Some message")
+
+    def test_disabled(self):
+        self.logger.setLevel(logging.WARNING)
+        EventLog('test_eventlog.events').log(Change(1))
+        self.assertIsNone(self.handler.stream)
+
+    def test_logger_filter(self):
+        event_log = EventLog('test_eventlog.events')
+        sampled = SamplingFilter(sample_rate=0.0)
+        self.logger.addFilter(sampled)
+        try:
+            for i in range(10):
+                event_log.log(Change(i, "updated"))
+            self.logger.info("Some message")
+        finally:
+            self.logger.removeFilter(sampled)
+        event_log.log(Change(10, "created"))
+        lines = self.read_lines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]['event']['id'], 10)
+        self.logger.disabled = True
+        try:
+            event_log.log(Change(11, "created"))
+        finally:
+            self.logger.disabled = False
+        self.assertEqual(len(self.read_lines()), 1)
+
+    def test_closed(self):
+        event_log = EventLog('test_eventlog.events')
+        event_log.log(Change(1, "created"))
+        self.handler.close()
+        event_log.log(Change(2, "created"))
+        self.logger.info("Some message")
+        self.assertEqual(len(self.handler._queue), 0)
+        with open(self.filename) as fh:
+            self.assertEqual(len(fh.readlines()), 1)
+
+    def test_sampling_filter(self):
+        record = self.logger.makeRecord('x', logging.INFO, 'f', 0, "m",
+                                        None, None)
+        self.assertFalse(SamplingFilter(sample_rate=0.0).filter(record))
+        limited = SamplingFilter(max_per_second=5)
+        self.assertEqual(sum(limited.filter(record) for i in range(20)), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
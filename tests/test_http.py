@@ -0,0 +1,136 @@
+"""Test the HTTP interface."""
+import unittest
+
+from tornado.testing import AsyncHTTPTestCase
+
+from simulator.changememory import DynamicChangeList
+from simulator.http import HTTPInterface
+from simulator.profiler import SamplingProfiler
+from simulator.source import DynamicResourceListBuilder, Source
+
+
+def make_source(path=None, number_of_resources=10):
+    """Return a bootstrapped source, served under path if given.
+
+    The source has a dynamic resource list and change list.
+    """
+    config = {}
+    config['name'] = "ResourceSync Simulator"
+    config['number_of_resources'] = number_of_resources
+    config['change_delay'] = 2
+    config['event_types'] = ['create', 'update', 'delete']
+    config['average_payload'] = 100
+    config['max_events'] = -1
+    base_uri = "http://localhost:8888"
+    if path is not None:
+        config['path'] = path
+        base_uri += "/" + path
+    source = Source(config, base_uri, "8888")
+    source.add_resource_list_builder(DynamicResourceListBuilder(
+        source, {'class': 'DynamicResourceListBuilder',
+                 'uri_path': 'resourcelist.xml'}))
+    source.add_changememory(DynamicChangeList(
+        source, {'class': 'DynamicChangeList', 'uri_path': 'changelist.xml',
+                 'max_changes': 100}))
+    source.bootstrap()
+    return source
+
+
+class TestSingleSource(AsyncHTTPTestCase):
+
+    def get_app(self):
+        self.source = make_source()
+        return HTTPInterface(self.source).application()
+
+    def test_routes(self):
+        self.assertIn(b"ResourceSync", self.fetch('/').body)
+        basename = self.source.random_resource.basename
+        response = self.fetch('/resources/' + basename)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers['Etag'],
+                         '"%s"' % self.source.resource(basename).md5)
+        self.assertEqual(self.fetch('/resources/100000').code, 404)
+        self.assertEqual(self.fetch('/resources?limit=5').code, 200)
+        self.assertIn(b"<urlset", self.fetch('/resourcelist.xml').body)
+        self.assertIn(b"<urlset", self.fetch('/changelist.xml').body)
+        self.assertIn(b"capabilitylist",
+                      self.fetch('/.well-known/resourcesync').body)
+        self.assertEqual(self.fetch('/tenant1/resources/1').code, 404)
+        self.assertEqual(self.fetch('/admin/ready').code, 200)
+
+
+class TestManySources(AsyncHTTPTestCase):
+
+    def get_app(self):
+        self.sources = [make_source("tenant%d" % i) for i in range(1, 4)]
+        self.http_interface = HTTPInterface(self.sources[0])
+        for source in self.sources[1:]:
+            self.http_interface.add_source(source)
+        return self.http_interface.application()
+
+    def test_index(self):
+        body = self.fetch('/').body
+        for i in range(1, 4):
+            self.assertIn(b'href="http://localhost:8888/tenant%d/"' % i, body)
+
+    def test_routes(self):
+        for source in self.sources:
+            prefix = source.path_prefix
+            basename = source.random_resource.basename
+            response = self.fetch(prefix + '/resources/' + basename)
+            self.assertEqual(response.code, 200)
+            self.assertEqual(response.headers['Etag'],
+                             '"%s"' % source.resource(basename).md5)
+            self.assertIn(source.base_uri.encode('utf-8'),
+                          self.fetch(prefix + '/').body)
+            self.assertEqual(self.fetch(prefix).code, 200)
+            body = self.fetch(prefix + '/resourcelist.xml').body
+            self.assertIn(b"<loc>%s/resources/" % source.base_uri.encode(),
+                          body)
+            self.assertEqual(
+                self.fetch(prefix + '/changelist.xml').code, 200)
+            self.assertEqual(
+                self.fetch(prefix + '/capabilitylist.xml').code, 200)
+            self.assertEqual(
+                self.fetch(prefix + '/static/resourcesync.css').code, 200)
+        for path in ('/tenant4/', '/tenant4/resources/1',
+                     '/tenant4/resourcelist.xml', '/tenant4/static/x.css',
+                     '/resources/1', '/resourcelist.xml', '/a/b/'):
+            self.assertEqual(self.fetch(path).code, 404, path)
+        self.assertEqual(self.fetch('/admin/ready').code, 200)
+
+    def test_add_source(self):
+        for path in ("tenant1", "admin", "static", "a/b"):
+            self.assertRaises(ValueError, self.http_interface.add_source,
+                              make_source(path, 1))
+        self.assertEqual(len(self.http_interface.source_handlers), 7)
+
+
+class TestProfileHandler(AsyncHTTPTestCase):
+
+    def get_app(self):
+        self.profiler = SamplingProfiler()
+        return HTTPInterface(make_source(), self.profiler).application()
+
+    def tearDown(self):
+        self.profiler.stop()
+        super(TestProfileHandler, self).tearDown()
+
+    def post(self, path):
+        return self.fetch(path, method='POST', body='')
+
+    def test_bad_interval(self):
+        for interval in ('0', '-1', 'nan', 'x'):
+            response = self.post('/admin/profile/start?interval=' + interval)
+            self.assertEqual(response.code, 400)
+            self.assertFalse(self.profiler.running)
+        response = self.post('/admin/profile/start?interval=0.5')
+        self.assertEqual(response.code, 200)
+        self.assertTrue(self.profiler.running)
+        self.assertEqual(self.profiler.interval, 0.5)
+        self.assertEqual(self.post('/admin/profile/stop').code, 200)
+        self.assertFalse(self.profiler.running)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+"""Test disk-backed payload stores."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from simulator.payload import BlobPayloadStore, CorpusPayloadStore
+from simulator.source import Source, compute_md5_for_string
+
+
+class TestPayloadStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        config = {}
+        config['name'] = "ResourceSync Simulator"
+        config['number_of_resources'] = 100
+        config['event_types'] = ['create', 'update', 'delete']
+        config['average_payload'] = 1000
+        config['max_events'] = -1
+        self.source = Source(config, "http://localhost:8888", "8888")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_blob(self):
+        path = os.path.join(self.tmpdir, 'blob')
+        store = BlobPayloadStore(self.source, {'path': path, 'size': 5000,
+                                               'seed': 3})
+        self.source.add_payload_store(store)
+        self.source.bootstrap()
+        self.assertEqual(os.path.getsize(path), 5000)
+        for basename in self.source._repository:
+            entry = self.source._repository[basename]
+            payload = self.source.resource_payload(basename)
+            self.assertTrue(isinstance(payload, memoryview))
+            self.assertEqual(len(payload), entry['length'])
+            self.assertEqual(compute_md5_for_string(payload), entry['md5'])
+        # Same seed gives the same blob
+        with open(path, 'rb') as fh:
+            blob = fh.read()
+        os.remove(path)
+        BlobPayloadStore(self.source, {'path': path, 'size': 5000,
+                                       'seed': 3}).bootstrap()
+        with open(path, 'rb') as fh:
+            self.assertEqual(fh.read(), blob)
+
+    def test_blob_seed(self):
+        path = os.path.join(self.tmpdir, 'blob')
+        store = BlobPayloadStore(self.source, {'path': path, 'size': 5000,
+                                               'seed': 3})
+        store.bootstrap()
+        payload = store.payload("1", 1000, 1.0)
+        data = bytes(payload)
+        with open(path, 'rb') as fh:
+            blob = fh.read()
+        # Another seed replaces the blob, the mapped one is still readable
+        BlobPayloadStore(self.source, {'path': path, 'size': 5000,
+                                       'seed': 4}).bootstrap()
+        with open(path, 'rb') as fh:
+            self.assertNotEqual(fh.read(), blob)
+        self.assertEqual(bytes(payload), data)
+        other = BlobPayloadStore(self.source, {'path': path, 'size': 5000,
+                                               'seed': 3})
+        other.bootstrap()
+        self.assertEqual(bytes(other.payload("1", 1000, 1.0)), data)
+        self.assertEqual(os.listdir(self.tmpdir), ['blob'])
+        # Reused if the seed matches
+        mtime = os.path.getmtime(path)
+        os.utime(path, (mtime - 100, mtime - 100))
+        BlobPayloadStore(self.source, {'path': path, 'size': 5000,
+                                       'seed': 3}).bootstrap()
+        self.assertEqual(os.path.getmtime(path), mtime - 100)
+
+    def test_update_changes_payload(self):
+        path = os.path.join(self.tmpdir, 'blob')
+        store = BlobPayloadStore(self.source, {'path': path, 'size': 100000})
+        self.source.add_payload_store(store)
+        self.source.bootstrap()
+        basename = self.source.random_resource.basename
+        payload = bytes(store.payload(basename, 500, 1.0))
+        self.assertEqual(bytes(store.payload(basename, 500, 1.0)), payload)
+        self.assertNotEqual(bytes(store.payload(basename, 500, 2.0)), payload)
+
+    def test_corpus(self):
+        for (name, size) in (('a', 10), ('b', 2000), ('c', 0)):
+            with open(os.path.join(self.tmpdir, name), 'wb') as fh:
+                fh.write(os.urandom(size))
+        store = CorpusPayloadStore(
+            self.source, {'corpus': os.path.join(self.tmpdir, '*')})
+        self.source.add_payload_store(store)
+        self.source.bootstrap()
+        self.assertEqual(len(store.files), 2)
+        for length in (0, 5, 10, 11, 1000):
+            self.assertEqual(len(store.payload("1", length, 1.0)), length)
+
+    def test_too_small(self):
+        with open(os.path.join(self.tmpdir, 'a'), 'wb') as fh:
+            fh.write(b'x' * 10)
+        store = CorpusPayloadStore(
+            self.source, {'corpus': [os.path.join(self.tmpdir, 'a')]})
+        self.source.add_payload_store(store)
+        self.assertRaises(ValueError, self.source.bootstrap)
+
+
+if __name__ == '__main__':
+    unittest.main()
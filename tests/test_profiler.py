@@ -0,0 +1,61 @@
+"""Test the profiling hooks."""
+import re
+import time
+import unittest
+
+from simulator.profiler import PhaseTimer, SamplingProfiler
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_sample(self):
+        profiler = SamplingProfiler()
+        profiler.sample()
+        profiler.sample()
+        self.assertEqual(profiler.samples, 2)
+        stacks = profiler.collapsed().splitlines()
+        own = [line for line in stacks
+               if 'test_sample (test_profiler.py:' in line]
+        self.assertEqual(len(own), 1)
+        self.assertTrue(own[0].startswith('MainThread;'))
+        self.assertTrue(own[0].endswith(';sample (profiler.py:%d) 2'
+                                        % SamplingProfiler.sample
+                                        .__code__.co_firstlineno))
+        profiler.clear()
+        self.assertEqual(profiler.samples, 0)
+        self.assertEqual(profiler.collapsed(), '')
+
+    def test_start_stop(self):
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start()
+        self.assertTrue(profiler.running)
+        time.sleep(0.05)
+        profiler.stop()
+        self.assertFalse(profiler.running)
+        samples = profiler.samples
+        self.assertTrue(samples > 0)
+        time.sleep(0.01)
+        self.assertEqual(profiler.samples, samples)
+        self.assertNotIn('SamplingProfiler;', profiler.collapsed())
+
+    def test_bad_interval(self):
+        profiler = SamplingProfiler()
+        for interval in (0, 0.0, -1.0, float('nan')):
+            self.assertRaises(ValueError, profiler.start, interval)
+            self.assertFalse(profiler.running)
+        self.assertEqual(profiler.interval, 0.01)
+
+    def test_phase_timer(self):
+        timer = PhaseTimer()
+        with timer.phase('generate'):
+            pass
+        with timer.phase('write'):
+            time.sleep(0.01)
+        self.assertTrue(re.match(r'^generate;dur=\d+\.\d{3}, '
+                                 r'write;dur=\d+\.\d{3}$',
+                                 timer.server_timing()))
+        self.assertTrue(timer.phases[1][1] >= 0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
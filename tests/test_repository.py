@@ -0,0 +1,140 @@
+"""Test the compact resource repository."""
+import sys
+import threading
+import unittest
+
+from simulator.repository import Repository
+from simulator.sitemap import datetime_to_str
+
+
+class TestRepository(unittest.TestCase):
+
+    def setUp(self):
+        self.repository = Repository()
+        for i in range(1, 21):
+            self.repository.set(str(i), 1000.5 * i, i, "%032x" % i)
+
+    def test_mapping(self):
+        self.assertEqual(len(self.repository), 20)
+        self.assertTrue("7" in self.repository)
+        self.assertFalse("0" in self.repository)
+        self.assertFalse("07" in self.repository)
+        self.assertFalse(7 in self.repository)
+        self.assertFalse(-10 in self.repository)
+        self.assertEqual(list(self.repository)[:3], ["1", "2", "3"])
+        self.assertEqual(self.repository["7"],
+                         {'timestamp': 7003.5, 'length': 7,
+                          'md5': "%032x" % 7})
+        self.assertTrue(self.repository.get("21") is None)
+        self.assertRaises(KeyError, self.repository.__getitem__, "21")
+
+    def test_set_and_delete(self):
+        self.repository.set("1177", 1.0, 0, "%032x" % 0)
+        self.assertEqual(len(self.repository), 21)
+        self.assertEqual(self.repository["1177"]['length'], 0)
+        self.repository.set("1177", 2.0, 5, "%032x" % 5)
+        self.assertEqual(len(self.repository), 21)
+        self.assertEqual(self.repository["1177"]['length'], 5)
+        del self.repository["1177"]
+        self.assertEqual(len(self.repository), 20)
+        self.assertFalse("1177" in self.repository)
+        self.assertRaises(KeyError, self.repository.__delitem__, "1177")
+        self.assertRaises(KeyError, self.repository.set, "a", 1.0, 0, "00")
+
+    def test_lastmod(self):
+        self.assertEqual(self.repository.lastmod("3"), datetime_to_str(3001.5))
+        self.repository.set("3", 5.0, 3, "%032x" % 3)
+        self.assertEqual(self.repository.lastmod("3"), datetime_to_str(5.0))
+        self.assertTrue(self.repository.lastmod("30") is None)
+
+    def test_record(self):
+        self.assertEqual(self.repository.record("3"),
+                         (3001.5, datetime_to_str(3001.5), 3, "%032x" % 3))
+        del self.repository["3"]
+        self.assertTrue(self.repository.record("3") is None)
+
+    def test_records(self):
+        del self.repository["5"]
+        records = list(self.repository.records())
+        self.assertEqual([r[0] for r in records],
+                         sorted(str(i) for i in range(1, 21) if i != 5))
+        self.assertEqual(records[0], ("1", datetime_to_str(1000.5), 1,
+                                      "%032x" % 1))
+
+    def test_sorted_basenames_with_concurrent_deletes(self):
+        # Deleting ids 21.. moves the unchanged ids 1..20 placed after
+        # them in the id list, which must not make a snapshot skip them
+        repository = Repository()
+        for i in list(range(21, 20021)) + list(range(1, 21)):
+            repository.set(str(i), 1.0, 0, "%032x" % 0)
+        unchanged = set(str(i) for i in range(1, 21))
+        done = threading.Event()
+        rounds = []
+
+        def churn():
+            while not done.is_set():
+                for i in range(21, 20021):
+                    del repository[str(i)]
+                for i in range(21, 20021):
+                    repository.set(str(i), 1.0, 0, "%032x" % 0)
+                rounds.append(1)
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        thread = threading.Thread(target=churn)
+        thread.start()
+        try:
+            n = 0
+            while n < 100 or len(rounds) < 5:
+                n += 1
+                basenames = repository.sorted_basenames()
+                self.assertEqual(len(set(basenames)), len(basenames))
+                self.assertEqual(unchanged - set(basenames), set())
+        finally:
+            done.set()
+            thread.join()
+            sys.setswitchinterval(interval)
+
+    def test_random_basenames(self):
+        for number in (1, 3, 20, 100):
+            basenames = self.repository.random_basenames(number)
+            self.assertEqual(len(basenames), min(number, 20))
+            self.assertEqual(len(set(basenames)), len(basenames))
+            for basename in basenames:
+                self.assertTrue(basename in self.repository)
+        self.assertEqual(Repository().random_basenames(1), [])
+
+    def test_random_basenames_after_deletes(self):
+        for i in range(1, 20, 2):
+            del self.repository[str(i)]
+        for i in range(100, 110):
+            self.repository.set(str(i), 1.0, 0, "%032x" % 0)
+        expected = set(str(i) for i in range(2, 21, 2)) | \
+            set(str(i) for i in range(100, 110))
+        self.assertEqual(set(self.repository), expected)
+        self.assertEqual(set(self.repository.random_basenames(100)), expected)
+        for i in range(100):
+            self.assertTrue(self.repository.random_basenames(1)[0] in expected)
+
+    def test_page(self):
+        self.assertEqual(self.repository.page(0, 5), ['1', '2', '3', '4', '5'])
+        self.assertEqual(self.repository.page(18, 5), ['19', '20'])
+        self.assertEqual(self.repository.page(20, 5), [])
+        self.assertEqual(self.repository.page(0, 0), [])
+        # The index is updated on changes once built
+        for i in range(1, 20, 2):
+            del self.repository[str(i)]
+        self.repository.set("15", 1.0, 0, "%032x" % 0)
+        self.repository.set("30", 1.0, 0, "%032x" % 0)
+        self.assertEqual(self.repository.page(5, 4), ['12', '14', '15', '16'])
+        self.assertEqual(self.repository.page(10, 4), ['20', '30'])
+        # and rebuilt when the repository grows
+        self.repository.set("1000", 1.0, 0, "%032x" % 0)
+        self.assertEqual(self.repository.page(11, 4), ['30', '1000'])
+        expected = sorted(self.repository, key=int)
+        for offset in range(len(expected) + 1):
+            self.assertEqual(self.repository.page(offset, 3),
+                             expected[offset:offset + 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
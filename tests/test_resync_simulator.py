@@ -0,0 +1,71 @@
+"""Test the configuration handling of the resync-simulator script."""
+import importlib.machinery
+import importlib.util
+import os
+import unittest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                      'resync-simulator')
+
+
+def load_script():
+    """Load the resync-simulator script as a module."""
+    loader = importlib.machinery.SourceFileLoader('resync_simulator', SCRIPT)
+    spec = importlib.util.spec_from_loader(loader.name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+class TestSourceConfigs(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.source_configs = staticmethod(load_script().source_configs)
+
+    def configs(self, sources):
+        return self.source_configs(
+            {'source': {'name': "Source", 'number_of_resources': 10},
+             'sources': sources})
+
+    def test_single_source(self):
+        config = {'source': {'name': "Source"}}
+        self.assertEqual(self.source_configs(config), [{'name': "Source"}])
+
+    def test_sources(self):
+        configs = self.configs([{'path': 'a'},
+                                {'path': 'b', 'number_of_resources': 5}])
+        self.assertEqual(configs, [
+            {'name': "Source", 'number_of_resources': 10, 'path': 'a'},
+            {'name': "Source", 'number_of_resources': 5, 'path': 'b'}])
+
+    def test_copies(self):
+        configs = self.configs([{'path': '/tenant/', 'name': "Tenant",
+                                 'copies': 3}, {'path': 'large'}])
+        self.assertEqual([c['path'] for c in configs],
+                         ['tenant1', 'tenant2', 'tenant3', 'large'])
+        self.assertEqual([c['name'] for c in configs],
+                         ['Tenant 1', 'Tenant 2', 'Tenant 3', 'Source'])
+        self.assertFalse(any('copies' in c for c in configs))
+        self.assertEqual(configs[0]['number_of_resources'], 10)
+
+    def test_invalid(self):
+        for sources in ([], None, ['a'], [{'name': "A"}], [{'path': '/'}],
+                        [{'path': 5}],
+                        [{'path': 'a'}, {'path': '/a/'}],
+                        [{'path': 't', 'copies': 2}, {'path': 't2'}],
+                        [{'path': 't', 'copies': 0}],
+                        [{'path': 't', 'copies': 'two'}],
+                        [{'path': 't', 'copies': True}],
+                        [{'path': 'a/b'}], [{'path': 'admin'}],
+                        [{'path': 'static'}]):
+            self.assertRaises(ValueError, self.configs, sources)
+        # Copies need a name, from the entry or the source section
+        self.assertRaises(ValueError, self.source_configs,
+                          {'sources': [{'path': 't', 'copies': 2}]})
+        self.assertEqual(len(self.source_configs(
+            {'sources': [{'path': 't', 'name': "T", 'copies': 2}]})), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
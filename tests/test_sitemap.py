@@ -0,0 +1,112 @@
+"""Test fast sitemap serialization against the resync library."""
+import unittest
+import random
+import re
+from xml.etree.ElementTree import Element, tostring
+
+from resync.w3c_datetime import datetime_to_str as resync_datetime_to_str
+
+from simulator.changememory import DynamicChangeList
+from simulator.sitemap import datetime_to_str, escape_attrib, escape_cdata
+from simulator.source import Source, DynamicResourceListBuilder
+
+
+def strip_now(xml):
+    """Remove the at and until times which are set to 'now'."""
+    return re.sub(r' (at|until)="[^"]*"', '', xml)
+
+
+class TestSitemap(unittest.TestCase):
+
+    def make_source(self, spec_version='1.1', no_lastmod=False):
+        config = {}
+        config['name'] = "ResourceSync Simulator"
+        config['number_of_resources'] = 200
+        config['event_types'] = ['create', 'update', 'delete']
+        config['average_payload'] = 100
+        config['max_events'] = -1
+        source = Source(config, "http://localhost:8888", "8888",
+                        spec_version, no_lastmod)
+        builder = DynamicResourceListBuilder(
+            source, {'uri_path': 'resourcelist.xml'})
+        source.add_resource_list_builder(builder)
+        changememory = DynamicChangeList(
+            source, {'uri_path': 'changelist.xml', 'max_changes': 100})
+        source.add_changememory(changememory)
+        source.bootstrap()
+        for basename in random.sample(list(source._repository), 20):
+            source._update_resource(basename)
+        for basename in random.sample(list(source._repository), 20):
+            source._delete_resource(basename)
+        for i in range(20):
+            source._create_resource()
+        return source
+
+    def resync_resource_list(self, source):
+        resource_list = source.resource_list_builder.generate()
+        resource_list.describedby = source.describedby_uri
+        resource_list.up = source.capability_list_uri
+        resource_list.md_at = 'now'
+        return resource_list.as_xml()
+
+    def resync_change_list(self, source):
+        change_list = source.changememory.generate()
+        change_list.describedby = source.describedby_uri
+        change_list.up = source.capability_list_uri
+        first = change_list.resources[0]
+        change_list.md_from = (first.timestamp if first.timestamp is not None
+                               else first.ts_datetime)
+        change_list.md_until = 'now'
+        return change_list.as_xml()
+
+    def test_datetime_to_str(self):
+        for ts in [None, 0, 0.0, 1.5, 1234567890, 1234567890.9999999,
+                   1600000000.0000005, 1600000000.123456]:
+            self.assertEqual(datetime_to_str(ts), resync_datetime_to_str(ts))
+        for i in range(10000):
+            ts = random.uniform(0, 2000000000)
+            self.assertEqual(datetime_to_str(ts), resync_datetime_to_str(ts))
+
+    def test_resource_list(self):
+        for (spec_version, no_lastmod) in [('1.1', False), ('1.1', True),
+                                           ('1.0', False)]:
+            source = self.make_source(spec_version, no_lastmod)
+            xml = source.resource_list_builder.as_xml(
+                describedby=source.describedby_uri,
+                up=source.capability_list_uri)
+            self.assertEqual(strip_now(xml),
+                             strip_now(self.resync_resource_list(source)))
+
+    def test_change_list(self):
+        for (spec_version, no_lastmod) in [('1.1', False), ('1.1', True),
+                                           ('1.0', False)]:
+            source = self.make_source(spec_version, no_lastmod)
+            xml = source.changememory.as_xml(
+                describedby=source.describedby_uri,
+                up=source.capability_list_uri)
+            self.assertEqual(strip_now(xml),
+                             strip_now(self.resync_change_list(source)))
+
+    def test_escape(self):
+        self.assertEqual(escape_attrib(''), '')
+        for text in ['plain', '&', '<', '>', '"', "'", '\n',
+                     'a&b<c>d"e\nf&amp;', 'http://x/a&b?c=<1>"2"\n']:
+            element = Element('x', a=text)
+            element.text = text
+            self.assertEqual(tostring(element, encoding='unicode'),
+                             '<x a="%s">%s</x>'
+                             % (escape_attrib(text), escape_cdata(text)))
+
+    def test_escaping(self):
+        source = self.make_source()
+        source.base_uri = "http://localhost:8888/a&b"
+        xml = source.resource_list_builder.as_xml(
+            describedby="http://example.org/?a=1&b=\"2\"")
+        resource_list = source.resource_list_builder.generate()
+        resource_list.describedby = "http://example.org/?a=1&b=\"2\""
+        resource_list.md_at = 'now'
+        self.assertEqual(strip_now(xml), strip_now(resource_list.as_xml()))
+
+
+if __name__ == '__main__':
+    unittest.main()
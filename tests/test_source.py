@@ -1,5 +1,7 @@
 import unittest
 import random
+import subprocess
+import sys
 
 from simulator.resource import Resource
 from simulator.source import Source
@@ -26,6 +28,18 @@ class TestSource(unittest.TestCase):
         self.assertTrue(self.source.resource_list_builder is None)
         self.assertTrue(self.source.changememory is None)
 
+    def test_bootstrapped(self):
+        self.assertTrue(self.source.bootstrapped)
+        source = Source(self.source.config, "http://localhost:8888", "8888")
+        self.assertFalse(source.bootstrapped)
+
+    def test_no_resync_import(self):
+        """The resync library is only imported on use, for fast startup"""
+        code = ("import sys, simulator.source, simulator.changememory, "
+                "simulator.http; print('resync' in sys.modules)")
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(output.strip(), b'False')
+
     def test_base_uri(self):
         self.assertEqual(self.source.base_uri, "http://localhost:8888")
 
@@ -54,6 +68,22 @@ class TestSource(unittest.TestCase):
         resource = self.source.resource(-10)
         self.assertTrue(resource is None)
 
+    def test_resource_record(self):
+        rand_basename = random.choice(list(self.source._repository))
+        resource = self.source.resource(rand_basename)
+        record = self.source.resource_record(rand_basename)
+        self.assertEqual(record, (resource.uri, resource.lastmod,
+                                  resource.length, resource.md5,
+                                  resource.timestamp))
+        # Cached values are refreshed on update and base URI change
+        self.source._update_resource(basename=rand_basename)
+        self.assertEqual(self.source.resource_record(rand_basename)[1],
+                         self.source.resource(rand_basename).lastmod)
+        self.source.base_uri = "http://example.org"
+        self.assertEqual(self.source.resource_record(rand_basename)[0],
+                         "http://example.org/resources/%s" % rand_basename)
+        self.assertTrue(self.source.resource_record("-10") is None)
+
     def test_resource_payload(self):
         # Fetch a random basename from the source repository
         rand_basename = random.choice(list(self.source._repository))